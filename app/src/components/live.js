@@ -4,7 +4,7 @@ import React from 'react';
 import { Alert, Col, Row, Button, Table } from 'react-bootstrap';
 import { Link } from 'react-router-dom';
 
-import { REFRESH, queryApi } from './utils.js'
+import { queryApi, subscribeApi, updateTask } from './utils.js'
 
 class LivePage extends React.Component {
 
@@ -50,15 +50,26 @@ class LivePage extends React.Component {
     }
 
 
-    componentDidMount() {
+    async componentDidMount() {
         console.log("Mounted!")
-        this.updateTasks()
-        this.interval = setInterval(() => this.updateTasks(), REFRESH);
-        //this.interval_logs = setInterval(() => this.updateLogs(), 5000);
+        const mounted = this.mounted = {};
+        const events = await subscribeApi("/events", {
+            task: task => this.setState(state => ({tasks: updateTask(state.tasks, task)})),
+            log: log => this.setState(state => ({logs: [log, ...state.logs].slice(0, 5)})),
+        }, () => this.updateTasks())
+        if (this.mounted !== mounted) {
+            // Unmounted while connecting
+            events.close();
+            return;
+        }
+        this.events = events;
     }
     componentWillUnmount() {
-        clearInterval(this.interval);
-        //clearInterval(this.interval_logs);
+        this.mounted = null;
+        if (this.events) {
+            this.events.close();
+            this.events = null;
+        }
     }
 }
 
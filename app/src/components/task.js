@@ -4,7 +4,7 @@ import React from 'react';
 import { Col, Row, Form, Button, Table, Card } from 'react-bootstrap';
 import { Routes, Route, useParams, Link } from 'react-router-dom';
 
-import { REFRESH, queryApi, getVariant, getStatus } from './utils.js'
+import { queryApi, subscribeApi, updateTask, getVariant, getStatus } from './utils.js'
 
 class TaskPage extends React.Component {
 
@@ -24,14 +24,24 @@ class TaskPage extends React.Component {
         })
     }
 
-    componentDidMount() {
-        this.updateTasks()
-        this.interval = setInterval(() => this.updateTasks(), REFRESH);
-        //this.interval_logs = setInterval(() => this.updateLogs(), 5000);
+    async componentDidMount() {
+        const mounted = this.mounted = {};
+        const events = await subscribeApi("/events", {
+            task: task => this.setState(state => ({tasks: updateTask(state.tasks, task)})),
+        }, () => this.updateTasks())
+        if (this.mounted !== mounted) {
+            // Unmounted while connecting
+            events.close();
+            return;
+        }
+        this.events = events;
     }
     componentWillUnmount() {
-        clearInterval(this.interval);
-        //clearInterval(this.interval_logs);
+        this.mounted = null;
+        if (this.events) {
+            this.events.close();
+            this.events = null;
+        }
     }
 
     render() {
@@ -53,6 +53,28 @@ async function queryApi(route, method="GET") {
     return data
 }
 
+async function subscribeApi(route, handlers, onOpen) {
+    // Listen Server-Sent Events from the API
+    const host = await backend.getHost()
+    const source = new EventSource(host + route)
+    if (onOpen) {
+        // Also called on reconnect to catch up missed changes
+        source.onopen = onOpen
+    }
+    for (const [event, handler] of Object.entries(handlers)) {
+        source.addEventListener(event, msg => handler(JSON.parse(msg.data)))
+    }
+    return source
+}
+
+function updateTask(tasks, task) {
+    // Replace the task of the same name or add a new task
+    if (!tasks.some(item => item.name === task.name)) {
+        return [...tasks, task]
+    }
+    return tasks.map(item => item.name === task.name ? task : item)
+}
+
 function getVariant(status) {
     return {
         success: "success", run: "warning", fail: "danger", null: "dark"
@@ -72,4 +94,4 @@ function getStatus(status) {
     }[status]
 }
 
-export { REFRESH, queryApi, getVariant, getStatus };
\ No newline at end of file
+export { REFRESH, queryApi, subscribeApi, updateTask, getVariant, getStatus };
\ No newline at end of file
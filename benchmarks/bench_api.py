@@ -0,0 +1,128 @@
+"""Benchmark of the Rocketry API with large sessions
+
+Generates a session with many tasks and a log repository
+(in-memory or SQLite) with many records and calls the
+routes of create_rocketry_routes in-process.
+
+Run: python -m benchmarks.bench_api
+Save baseline: python -m benchmarks.bench_api --save-baseline baseline.json
+Compare: python -m benchmarks.bench_api --baseline baseline.json
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI
+from redbird.repos import MemoryRepo
+from rocketry import Rocketry
+from rocketry.conds import daily
+from rocketry.log import MinimalRecord
+
+from benchmarks.utils import compare_results, get_scope, measure, print_table, run, save_results
+from subsystems.api.router import create_rocketry_routes
+
+ACTIONS = ("run", "success", "run", "fail")
+
+class LogRecord(MinimalRecord):
+    # SQL tables need a primary key
+    id: Optional[int]
+
+def do_nothing():
+    ...
+
+def generate_logs(n_tasks:int, n_logs:int, seed:int=0):
+    "Generate log records, oldest first"
+    rand = random.Random(seed)
+    created = 1_600_000_000.0
+    for i in range(n_logs):
+        created += rand.random()
+        yield {"id": i, "task_name": f"task-{rand.randrange(n_tasks)}", "action": ACTIONS[i % len(ACTIONS)], "created": created}
+
+def create_memory_repo(n_tasks:int, n_logs:int, **kwargs):
+    collection = [MinimalRecord.construct(**{key: val for key, val in row.items() if key != "id"}) for row in generate_logs(n_tasks, n_logs)]
+    return MemoryRepo(model=MinimalRecord, collection=collection)
+
+def create_sql_repo(n_tasks:int, n_logs:int, directory:str):
+    import sqlalchemy
+    import sqlalchemy.orm
+    from redbird.repos import SQLRepo
+    repo = SQLRepo(model=LogRecord, conn_string=f"sqlite:///{Path(directory) / 'logs.db'}", table="task_log", if_missing="create", id_field="id")
+    table = repo.model_orm.__table__
+    with repo.session.bind.begin() as conn:
+        rows = []
+        for row in generate_logs(n_tasks, n_logs):
+            rows.append(row)
+            if len(rows) == 50_000:
+                conn.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(table.insert(), rows)
+    # As a production log table would have
+    sqlalchemy.Index("ix_task_log_created", table.c.created).create(repo.session.bind)
+    sqlalchemy.Index("ix_task_log_task_name_created", table.c.task_name, table.c.created).create(repo.session.bind)
+    return repo
+
+def create_scheduler(repo, n_tasks:int) -> Rocketry:
+    scheduler = Rocketry(logger_repo=repo, execution="async")
+    for i in range(n_tasks):
+        scheduler.task(daily, func=do_nothing, name=f"task-{i}")
+    return scheduler
+
+def create_app(repo, n_tasks:int, **kwargs) -> FastAPI:
+    app = FastAPI()
+    app.include_router(create_rocketry_routes(create_scheduler(repo, n_tasks), **kwargs))
+    return app
+
+async def main(repos, n_tasks:int, n_logs:int, n:int, max_seconds:float):
+    task = f"task-{n_tasks // 2}"
+    cases = [
+        ("GET", "/tasks", ""),
+        ("GET", f"/tasks/{task}", ""),
+        ("GET", "/logs", "limit=100"),
+        ("GET", "/logs", f"limit=100&task={task}"),
+        ("POST", f"/task/{task}/logs", ""),
+        ("POST", f"/tasks/{task}/disable", ""),
+        ("POST", f"/tasks/{task}/enable", ""),
+        ("POST", f"/tasks/{task}/run", ""),
+    ]
+    factories = {"memory": create_memory_repo, "sql": create_sql_repo}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for repo_type in repos:
+            start = time.perf_counter()
+            repo = factories[repo_type](n_tasks, n_logs, directory=tmpdir)
+            app = create_app(repo, n_tasks)
+            print(f"Created {repo_type} session ({n_tasks} tasks, {n_logs} logs) in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+            for method, path, query in cases:
+                # Task names are generalized so cases are comparable with other sizes
+                case = f"{repo_type} {method} {path}{'?' + query if query else ''}".replace(task, "{task}")
+                results[case] = await measure(app, get_scope(path, method=method, query=query), n=n, warmup=min(n, 10), max_seconds=max_seconds)
+                print(f"{case}: done", file=sys.stderr)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10_000, help="Number of tasks in the session")
+    parser.add_argument("--logs", type=int, default=1_000_000, help="Number of log records")
+    parser.add_argument("--repo", choices=["memory", "sql"], action="append", help="Log repositories to benchmark (default: all)")
+    parser.add_argument("-n", type=int, default=500, help="Maximum number of requests per case")
+    parser.add_argument("--max-seconds", type=float, default=10, help="Maximum time per case")
+    parser.add_argument("--baseline", help="Compare to a baseline file")
+    parser.add_argument("--save-baseline", help="Save the results as a baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative increase of p50 compared to the baseline")
+    args = parser.parse_args()
+
+    results = run(main, args.repo or ["memory", "sql"], args.tasks, args.logs, n=args.n, max_seconds=args.max_seconds)
+    print_table(results)
+    if args.save_baseline:
+        save_results(args.save_baseline, results)
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, tolerance=args.tolerance)
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,47 @@
+"""Benchmark of the fast JSON path of the Rocketry API
+
+Compares the default responses (validated by FastAPI
+and encoded by jsonable_encoder) to fast_json=True.
+
+Run: python -m benchmarks.bench_json
+"""
+import argparse
+
+from fastapi import FastAPI
+
+from benchmarks.bench_api import create_memory_repo, create_scheduler
+from benchmarks.utils import get_scope, measure, print_table, run
+from subsystems.api import encoding
+from subsystems.api.router import create_rocketry_routes
+
+async def main(n_tasks:int, n_logs:int, limit:int, n:int, max_seconds:float):
+    repo = create_memory_repo(n_tasks, n_logs)
+    scheduler = create_scheduler(repo, n_tasks)
+    apps = {}
+    for name, fast_json in [("default", False), ("fast", True)]:
+        app = FastAPI()
+        app.include_router(create_rocketry_routes(scheduler, fast_json=fast_json))
+        apps[name] = app
+
+    cases = [
+        ("/tasks", ""),
+        ("/tasks/task-0", ""),
+        ("/logs", f"limit={limit}"),
+    ]
+    results = {}
+    for path, query in cases:
+        for name, app in apps.items():
+            case = f"{path}{'?' + query if query else ''} ({name})"
+            results[case] = await measure(app, get_scope(path, query=query), n=n, warmup=min(n, 10), max_seconds=max_seconds)
+    print(f"Encoder: {'orjson' if encoding.orjson is not None else 'json'}")
+    print_table(results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1000, help="Number of tasks in the session")
+    parser.add_argument("--logs", type=int, default=100_000, help="Number of log records")
+    parser.add_argument("--limit", type=int, default=1000, help="Number of log records per request")
+    parser.add_argument("-n", type=int, default=500, help="Maximum number of requests per case")
+    parser.add_argument("--max-seconds", type=float, default=10, help="Maximum time per case")
+    args = parser.parse_args()
+    run(main, args.tasks, args.logs, args.limit, n=args.n, max_seconds=args.max_seconds)
@@ -0,0 +1,52 @@
+"""Benchmark of the import time of the CLI
+
+Imports subsystems.main_cli in fresh interpreters with
+-X importtime and reports the median cumulative time and
+the slowest imports.
+
+Run: python -m benchmarks.bench_startup
+Check a budget: python -m benchmarks.bench_startup --max-ms 50
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict
+
+def measure_imports(module:str) -> Dict[str, int]:
+    "Cumulative import times (microseconds) of the module and its imports"
+    code = f"import {module}"
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True).stderr
+    # First line is the header
+    lines = [line.split("|") for line in output.splitlines() if line.startswith("import time:")][1:]
+    rows = [(name.strip(), len(name) - len(name.lstrip()), int(cum)) for _, cum, name in lines]
+    # Imports of a module are listed right before it and
+    # are indented deeper (others are from the startup)
+    end = next(i for i, (name, _, _) in enumerate(rows) if name == module)
+    depth = rows[end][1]
+    start = end
+    while start > 0 and rows[start - 1][1] > depth:
+        start -= 1
+    return {name: cum for name, _, cum in rows[start:end + 1]}
+
+def main(module:str, n:int, top:int) -> float:
+    runs = [measure_imports(module) for _ in range(n)]
+    total = statistics.median(run[module] for run in runs) / 1000
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+    print(f"{module}: {total:.1f} ms (median of {n})")
+    for name, cum in slowest[1:top + 1]:
+        print(f"  {name:<40} {cum / 1000:>8.1f} ms")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="subsystems.main_cli", help="Module to import")
+    parser.add_argument("-n", type=int, default=10, help="Number of interpreters")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to show")
+    parser.add_argument("--max-ms", type=float, help="Fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    total = main(args.module, n=args.n, top=args.top)
+    if args.max_ms is not None and total > args.max_ms:
+        print(f"Import time exceeds {args.max_ms} ms", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,60 @@
+"""Benchmark of the custom routes and the index of StaticApp
+
+Compares the prebuilt responses to building the
+response on every request (as it was done before).
+The cases are run alternately and repeatedly and the
+medians are reported as single runs are noisy.
+
+Run: python -m benchmarks.bench_static
+"""
+import argparse
+import tempfile
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, JSONResponse
+
+from benchmarks.utils import get_scope, measure, median_stats, print_table, run
+from subsystems.apps import StaticApp
+
+CONFIG = {"backend_url": "http://127.0.0.1:8080"}
+
+def create_legacy_app(content:str, custom_routes:dict) -> FastAPI:
+    "App creating the responses on every request"
+    app = FastAPI()
+
+    @app.get("/")
+    async def get_root():
+        return HTMLResponse(content)
+
+    @app.get("/{full_path:path}")
+    async def get_page(full_path:str=None):
+        content = custom_routes[full_path]
+        return HTMLResponse(content) if isinstance(content, str) else JSONResponse(content)
+    return app
+
+async def main(n:int, repeat:int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        index = Path(tmpdir) / "index.html"
+        content = "<!doctype html><html><head><title>Subsystems</title></head><body><div id='root'></div></body></html>" * 10
+        index.write_text(content)
+        custom_routes = {"_config": CONFIG}
+
+        apps = {
+            "legacy": create_legacy_app(content, custom_routes),
+            "prebuilt": StaticApp(path=index, static_path=tmpdir, custom_routes=custom_routes),
+        }
+        runs = {}
+        for _ in range(repeat):
+            for route in ("/", "/_config"):
+                for name, app in apps.items():
+                    stats = await measure(app, get_scope(route, headers={"accept-encoding": "gzip"}), n=n)
+                    runs.setdefault(f"{route} ({name})", []).append(stats)
+        print_table({case: median_stats(stats) for case, stats in runs.items()})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=20000, help="Number of requests per case and run")
+    parser.add_argument("--repeat", type=int, default=7, help="Number of runs (median is reported)")
+    args = parser.parse_args()
+    run(main, args.n, args.repeat)
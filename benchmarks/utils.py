@@ -0,0 +1,87 @@
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+def get_scope(path:str, method:str="GET", query:str="", headers:Optional[Dict[str, str]]=None) -> dict:
+    "Create ASGI scope of a HTTP request"
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "root_path": "",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": [(key.lower().encode("latin-1"), val.encode("latin-1")) for key, val in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+
+async def call(app, scope:dict, body:bytes=b"") -> List[dict]:
+    "Call ASGI app and return the sent messages"
+    messages = []
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    async def send(message):
+        messages.append(message)
+    await app(scope, receive, send)
+    return messages
+
+async def measure(app, scope:dict, n:int=1000, warmup:int=50, body:bytes=b"", max_seconds:Optional[float]=None) -> Dict[str, float]:
+    "Measure throughput and latencies of a request"
+    for _ in range(warmup):
+        await call(app, scope, body)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(n):
+        req_start = time.perf_counter()
+        messages = await call(app, scope, body)
+        latencies.append(time.perf_counter() - req_start)
+        if max_seconds is not None and time.perf_counter() - start > max_seconds:
+            # Slow case, enough samples
+            break
+    total = time.perf_counter() - start
+    status = messages[0]["status"]
+    if status >= 400:
+        raise RuntimeError(f"Request failed with status {status}")
+    return get_stats(latencies, total)
+
+def get_stats(latencies:List[float], total:float) -> Dict[str, float]:
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "n": len(latencies),
+        "rps": len(latencies) / total,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+def median_stats(runs:List[Dict[str, float]]) -> Dict[str, float]:
+    "Median of each statistic over repeated runs"
+    return {key: statistics.median(stats[key] for stats in runs) for key in runs[0]}
+
+def print_table(results:Dict[str, Dict[str, float]]):
+    "Print results by case"
+    print(f"{'case':<40} {'rps':>10} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for case, stats in results.items():
+        print(f"{case:<40} {stats['rps']:>10.0f} {stats['p50_ms']:>10.3f} {stats['p99_ms']:>10.3f}")
+
+def save_results(path:str, results:Dict[str, Dict[str, float]]):
+    "Save results as a baseline"
+    Path(path).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+
+def compare_results(results:Dict[str, Dict[str, float]], path:str, tolerance:float=0.2) -> List[str]:
+    "Compare results to a baseline and return the regressed cases"
+    baseline = json.loads(Path(path).read_text())
+    regressions = []
+    print(f"\n{'case':<40} {'p50 (ms)':>10} {'baseline':>10} {'change':>8}")
+    for case, stats in results.items():
+        if case not in baseline:
+            continue
+        base = baseline[case]["p50_ms"]
+        change = stats["p50_ms"] / base - 1 if base else 0.0
+        regressed = change > tolerance
+        if regressed:
+            regressions.append(case)
+        print(f"{case:<40} {stats['p50_ms']:>10.3f} {base:>10.3f} {change:>+8.0%}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def run(func:Callable, *args, **kwargs):
+    return asyncio.run(func(*args, **kwargs))
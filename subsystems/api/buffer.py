@@ -0,0 +1,168 @@
+import logging
+import time
+from collections import deque
+from heapq import merge
+from typing import Dict, List, Optional
+
+from redbird.oper import In
+from redbird.repos import MemoryRepo
+from redbird.utils.query import QueryMatcher
+from rocketry import Session
+from rocketry.log import MinimalRecord
+
+from subsystems.api.logs import Cursor, locate_record
+
+class _Ring:
+    "Bounded buffer of (position, record) rows, oldest first"
+
+    def __init__(self, size:int, since:float):
+        self.rows = deque()
+        self.size = size
+        # All records created after this are in the ring
+        self.since = since
+
+    def append(self, row):
+        if len(self.rows) >= self.size:
+            self.evict()
+        self.rows.append(row)
+
+    def evict(self):
+        _, record = self.rows.popleft()
+        self.since = max(self.since, record.created)
+
+    def expire(self, min_created:float):
+        while self.rows and self.rows[0][1].created < min_created:
+            self.evict()
+
+class LogBuffer(logging.Handler):
+    """Ring buffer of the most recent task logs
+
+    Keeps a bounded buffer of all records and one
+    per task so that the queries for recent logs
+    can be answered without reading the log repo.
+
+    Parameters
+    ----------
+    size : int
+        Maximum number of records in the global buffer.
+    task_size : int
+        Maximum number of records per task.
+    max_age : float, optional
+        Records older than this (in seconds) are evicted.
+    """
+
+    def __init__(self, size:int=1000, task_size:int=100, max_age:Optional[float]=None):
+        super().__init__()
+        self.size = size
+        self.task_size = task_size
+        self.max_age = max_age
+
+        self.session = None
+        self.started = None
+        self.records = None
+        self.task_records: Dict[str, _Ring] = {}
+
+    def attach(self, session:Session):
+        "Start buffering the task logs of the session (if not already)"
+        logger = logging.getLogger(session.config.task_logger_basename)
+        if self in logger.handlers:
+            return
+        with self.lock:
+            # Records logged while detached are not buffered
+            self.session = session
+            self.started = time.time()
+            self.records = _Ring(self.size, since=self.started)
+            self.task_records = {}
+        logger.addHandler(self)
+
+    def detach(self):
+        logging.getLogger(self.session.config.task_logger_basename).removeHandler(self)
+
+    def emit(self, record:logging.LogRecord):
+        task_name = getattr(record, "task_name", None)
+        action = getattr(record, "action", None)
+        if task_name is None or action is None:
+            return
+        item = MinimalRecord.construct(task_name=task_name, action=action, created=record.created)
+        row = (locate_record(self.session.get_repo(), item), item)
+
+        ring = self.task_records.get(task_name)
+        if ring is None:
+            ring = self.task_records[task_name] = _Ring(self.task_size, since=self.started)
+        self.records.append(row)
+        ring.append(row)
+
+        if self.max_age is not None:
+            min_created = time.time() - self.max_age
+            self.records.expire(min_created)
+            ring.expire(min_created)
+
+    def read(self, query:dict, bounds, after:Cursor=None, before:Cursor=None, limit:int=None) -> Optional[List[tuple]]:
+        """Read (position, record) rows in the order of
+        subsystems.api.logs.read_logs or None if the buffer
+        does not cover the query"""
+        if (after is not None or before is not None) and not isinstance(self.session.get_repo(), MemoryRepo):
+            # Positions of the buffered records are not known
+            # for other repos, ties of created could be skipped
+            return None
+        min_created, max_created = bounds
+        matcher = QueryMatcher(query, value_getter=getattr)
+        with self.lock:
+            rings = self._get_rings(query)
+            since = max([self.started] + [ring.since for ring in rings])
+
+            if before is not None:
+                if before[0] <= since:
+                    return None
+                # Collect the newer records and turn them to ascending
+                rows = []
+                for row in self._iter_newest(rings):
+                    if not _is_newer(row, before):
+                        break
+                    if _in_bounds(row, bounds) and row[1] in matcher:
+                        rows.append(row)
+                rows.reverse()
+                return rows[:limit]
+
+            rows = []
+            for row in self._iter_newest(rings):
+                if limit is not None and len(rows) >= limit:
+                    return rows
+                if min_created is not None and row[1].created < min_created:
+                    break
+                if row[1].created <= since:
+                    # Some rings may have evicted records from here on
+                    break
+                if after is not None and _is_newer(row, after, or_equal=True):
+                    continue
+                if _in_bounds(row, bounds) and row[1] in matcher:
+                    rows.append(row)
+        if limit is not None and len(rows) >= limit:
+            return rows
+        if min_created is not None and min_created > since:
+            return rows
+        # Some of the requested records may be evicted
+        return None
+
+    def _get_rings(self, query:dict) -> List[_Ring]:
+        task = query.get("task_name")
+        if task is None:
+            return [self.records]
+        names = task.value if isinstance(task, In) else [task]
+        return [self.task_records[name] for name in names if name in self.task_records]
+
+    def _iter_newest(self, rings:List[_Ring]):
+        if len(rings) == 1:
+            return reversed(rings[0].rows)
+        return merge(*(reversed(ring.rows) for ring in rings), key=lambda row: row[1].created, reverse=True)
+
+def _is_newer(row, cursor:Cursor, or_equal=False) -> bool:
+    position, record = row
+    if position >= 0 and cursor[1] >= 0:
+        return position >= cursor[1] if or_equal else position > cursor[1]
+    return record.created >= cursor[0] if or_equal else record.created > cursor[0]
+
+def _in_bounds(row, bounds) -> bool:
+    min_created, max_created = bounds
+    created = row[1].created
+    return (min_created is None or created >= min_created) and (max_created is None or created <= max_created)
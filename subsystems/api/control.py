@@ -0,0 +1,400 @@
+"""Control channel of the scheduler process
+
+One process owns the Rocketry session and serves its
+API over a Unix socket. API workers forward the requests
+to it through pooled connections so that the workers are
+stateless and the tasks are run only once.
+
+Each request and response is a sequence of frames: a JSON
+head (request line or status and headers), the body as
+zero or more body frames and an end frame. Bodies are
+streamed so server-sent events and exports work as well.
+"""
+import asyncio
+import json
+import logging
+import os
+import struct
+from typing import AsyncIterator, List, Optional, Tuple
+
+from starlette.responses import StreamingResponse
+
+from subsystems.api.snapshots import SnapshotReader
+from subsystems.api.state import is_not_modified
+from subsystems.utils.assets import PrebuiltResponse
+
+logger = logging.getLogger(__name__)
+
+FRAME = struct.Struct("!cI")
+HEAD, BODY, END = b"H", b"B", b"E"
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+# As FastAPI responds
+NOT_FOUND = b'{"detail":"Not Found"}'
+
+# Meaningful only between the client and the worker
+HOP_BY_HOP_HEADERS = {b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"te", b"trailer"}
+
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+class ProtocolError(Exception):
+    "Invalid frame in the control channel"
+
+async def read_frame(reader:asyncio.StreamReader) -> Tuple[bytes, bytes]:
+    kind, size = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if kind not in (HEAD, BODY, END) or size > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Invalid frame: {kind!r} ({size} bytes)")
+    return kind, await reader.readexactly(size) if size else b""
+
+def write_frame(writer:asyncio.StreamWriter, kind:bytes, payload:bytes=b""):
+    writer.write(FRAME.pack(kind, len(payload)))
+    if payload:
+        writer.write(payload)
+
+class _StreamReader(asyncio.StreamReader):
+    "Stream reader telling when the peer has closed"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.closed = asyncio.Event()
+
+    def feed_eof(self):
+        super().feed_eof()
+        self.closed.set()
+
+    def set_exception(self, exc):
+        super().set_exception(exc)
+        self.closed.set()
+
+class ControlServer:
+    """Serve an ASGI app over a Unix socket
+
+    Parameters
+    ----------
+    app : ASGI app
+        App to serve (ie. AutoAPI).
+    path : str
+        Path of the Unix socket.
+    """
+
+    def __init__(self, app, path:str):
+        self.app = app
+        self.path = path
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            # Left from a previous run
+            os.unlink(self.path)
+        loop = asyncio.get_running_loop()
+        def create_protocol():
+            # As asyncio.start_unix_server but with our reader
+            return asyncio.StreamReaderProtocol(_StreamReader(loop=loop), self._handle, loop=loop)
+        self.server = await loop.create_unix_server(create_protocol, path=self.path)
+        # Only the owner's user may control the scheduler
+        os.chmod(self.path, 0o600)
+
+    async def close(self):
+        if self.server is None:
+            return
+        self.server.close()
+        await self.server.wait_closed()
+        self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _handle(self, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+        try:
+            while True:
+                kind, payload = await read_frame(reader)
+                if kind != HEAD:
+                    raise ProtocolError("Expected head of a request")
+                if not await self._serve(json.loads(payload), reader, writer):
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # Client closed the connection (possibly mid-frame)
+            pass
+        except ProtocolError as exc:
+            logger.warning(f"Closing control connection: {exc}")
+        finally:
+            writer.close()
+
+    async def _serve(self, request:dict, reader:_StreamReader, writer:asyncio.StreamWriter) -> bool:
+        "Serve a request and return whether the connection can be reused"
+        body = []
+        while True:
+            kind, payload = await read_frame(reader)
+            if kind == END:
+                break
+            body.append(payload)
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": request["method"], "scheme": "http", "root_path": "",
+            "path": request["path"], "raw_path": request["path"].encode(),
+            "query_string": request["query_string"].encode("latin-1"),
+            "headers": [(key.encode("latin-1"), val.encode("latin-1")) for key, val in request["headers"]],
+            "client": tuple(request["client"]) if request.get("client") else None,
+            "server": None,
+        }
+
+        received = False
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": b"".join(body), "more_body": False}
+            # Wait for the client to close without reading
+            # the stream as it carries the next request
+            await reader.closed.wait()
+            return {"type": "http.disconnect"}
+
+        started = False
+        ended = False
+        async def send(message):
+            nonlocal started, ended
+            if message["type"] == "http.response.start":
+                started = True
+                head = {
+                    "status": message["status"],
+                    "headers": [(key.decode("latin-1"), val.decode("latin-1")) for key, val in message.get("headers", [])],
+                }
+                write_frame(writer, HEAD, json.dumps(head).encode())
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    write_frame(writer, BODY, message["body"])
+                if not message.get("more_body", False):
+                    ended = True
+                    write_frame(writer, END)
+            await writer.drain()
+
+        try:
+            await self.app(scope, receive, send)
+        except ConnectionError:
+            # Client closed during the response
+            return False
+        except Exception:
+            logger.exception("Control request failed")
+            if started:
+                # Error response was sent (by a middleware)
+                # or the response is broken
+                return ended
+            write_frame(writer, HEAD, json.dumps({"status": 500, "headers": [("content-type", "text/plain")]}).encode())
+            write_frame(writer, BODY, b"Internal Server Error")
+            write_frame(writer, END)
+            await writer.drain()
+            return True
+        # Not finished if the client closed a stream (ie. events)
+        return ended
+
+class ControlClient:
+    """Client of the control channel with a connection pool
+
+    Parameters
+    ----------
+    path : str
+        Path of the Unix socket.
+    pool_size : int
+        Maximum number of connections. Requests wait for a
+        connection if all are in use.
+    """
+
+    def __init__(self, path:str, pool_size:int=10):
+        self.path = path
+        self.pool_size = pool_size
+        self._idle: List[Connection] = []
+        # Created in the event loop of the app
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def request(self, method:str, path:str, query_string:str="", headers:List[Tuple[str, str]]=(),
+                      body:bytes=b"", client:Optional[tuple]=None) -> Tuple[int, List[Tuple[str, str]], 'ResponseBody']:
+        """Send a request and return status, headers and the body stream
+
+        The body must be read fully or closed to free the connection."""
+        head = json.dumps({
+            "method": method, "path": path, "query_string": query_string,
+            "headers": list(headers), "client": client,
+        }).encode()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.pool_size)
+        await self._semaphore.acquire()
+        try:
+            while True:
+                reused = bool(self._idle)
+                conn = await self._acquire()
+                reader, writer = conn
+                try:
+                    write_frame(writer, HEAD, head)
+                    if body:
+                        write_frame(writer, BODY, body)
+                    write_frame(writer, END)
+                    await writer.drain()
+                    kind, payload = await read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    self._close(conn)
+                    if reused:
+                        # Pooled connection went stale (ie. the
+                        # scheduler process restarted), the request
+                        # was not handled
+                        continue
+                    raise
+                except BaseException:
+                    self._close(conn)
+                    raise
+                if kind != HEAD:
+                    self._close(conn)
+                    raise ProtocolError("Expected head of a response")
+                response = json.loads(payload)
+                return response["status"], response["headers"], ResponseBody(self, conn)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    async def _acquire(self) -> Connection:
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn[1].is_closing() and not conn[0].at_eof():
+                return conn
+            self._close(conn)
+        return await asyncio.open_unix_connection(self.path)
+
+    def _release(self, conn:Connection):
+        if len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            self._close(conn)
+
+    def _close(self, conn:Connection):
+        conn[1].close()
+
+    async def close(self):
+        "Close the idle connections"
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn)
+
+class ResponseBody:
+    "Body stream of a response from the control channel"
+
+    def __init__(self, client:ControlClient, conn:Connection):
+        self.client = client
+        self.conn = conn
+        self.finished = False
+        self.closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        reader, _ = self.conn
+        try:
+            while not self.closed:
+                kind, payload = await read_frame(reader)
+                if kind == END:
+                    self.finished = True
+                    return
+                yield payload
+        finally:
+            self.close()
+
+    def close(self):
+        "Free the connection"
+        if self.closed:
+            return
+        self.closed = True
+        if self.finished:
+            self.client._release(self.conn)
+        else:
+            # Response was not read fully, the
+            # connection cannot be reused
+            self.client._close(self.conn)
+        self.client._semaphore.release()
+
+class ControlProxy:
+    "ASGI app forwarding the requests to the control channel"
+
+    def __init__(self, client:ControlClient):
+        self.client = client
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        headers = [
+            (key.decode("latin-1"), val.decode("latin-1"))
+            for key, val in scope["headers"] if key.lower() not in HOP_BY_HOP_HEADERS
+        ]
+        try:
+            status, resp_headers, content = await self.client.request(
+                scope["method"], scope["path"],
+                query_string=scope["query_string"].decode("latin-1"), headers=headers,
+                body=b"".join(body), client=scope.get("client"),
+            )
+        except (OSError, asyncio.IncompleteReadError, ProtocolError) as exc:
+            logger.warning(f"Scheduler is not reachable: {exc}")
+            response = StreamingResponse(iter([b"Scheduler is not reachable"]), status_code=503, media_type="text/plain")
+        else:
+            # Streamed so that server-sent events pass through.
+            # Starlette listens for the disconnect of the client
+            # and closes the stream (and the connection) then.
+            response = StreamingResponse(content, status_code=status)
+            response.raw_headers = [
+                (key.encode("latin-1"), val.encode("latin-1"))
+                for key, val in resp_headers if key.encode("latin-1") not in HOP_BY_HOP_HEADERS
+            ]
+            try:
+                await response(scope, receive, send)
+            finally:
+                # The stream is not started if the client
+                # disconnected before it
+                content.close()
+            return
+        await response(scope, receive, send)
+
+class SnapshotProxy:
+    """ASGI app serving the tasks from a published snapshot
+
+    The tasks are read from the file published by the
+    scheduler process (SnapshotPublisher) and other
+    requests are forwarded to the control channel.
+    """
+
+    def __init__(self, reader:SnapshotReader, app):
+        self.reader = reader
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            response = self._get_response(scope)
+            if response is not None:
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+    def _get_response(self, scope) -> Optional[PrebuiltResponse]:
+        path = scope["path"]
+        if path == "/tasks":
+            task_name = None
+        elif path.startswith("/tasks/") and path[7:] and "/" not in path[7:]:
+            task_name = path[7:]
+        else:
+            return None
+        snapshot = self.reader.get()
+        if snapshot is None:
+            # Not published (yet) or stale, the
+            # scheduler process answers (or 503)
+            return None
+
+        body = snapshot.body if task_name is None else snapshot.get_task(task_name)
+        if body is None:
+            return PrebuiltResponse(NOT_FOUND, [(b"content-type", b"application/json"), (b"content-length", str(len(NOT_FOUND)).encode())], status_code=404)
+
+        headers = [(b"etag", snapshot.etag.encode("latin-1")), (b"cache-control", b"no-cache")]
+        if_none_match = next((val.decode("latin-1") for key, val in scope["headers"] if key == b"if-none-match"), None)
+        if is_not_modified(if_none_match, snapshot.etag):
+            return PrebuiltResponse(b"", headers, status_code=304)
+        return PrebuiltResponse(body, headers + [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())])
@@ -0,0 +1,47 @@
+import datetime
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from pydantic.datetime_parse import parse_datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(content:Any) -> bytes:
+    """Encode content to JSON
+
+    Uses orjson if installed. Types that are not natively
+    supported are converted as FastAPI would convert them.
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, default=jsonable_encoder,
+        ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    "JSON response using the fast encoder"
+
+    def render(self, content:Any) -> bytes:
+        return dumps(content)
+
+def log_to_dict(record) -> dict:
+    "Convert log record to the content of Log without validation"
+    data = vars(record) if not isinstance(record, dict) else record
+    created = data.get("created")
+    if created is not None and not isinstance(created, datetime.datetime):
+        # As pydantic parses it (ie. Unix timestamp)
+        created = parse_datetime(created)
+    return {"created": created, "task_name": data["task_name"], "action": data["action"]}
+
+def record_to_dict(record) -> dict:
+    "Convert log record to dict as FastAPI would"
+    if isinstance(record, BaseModel):
+        return record.dict(by_alias=True)
+    return record
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, List, Optional
+
+from rocketry import Session
+
+from subsystems.api.models import Log, TaskModel
+
+class Event:
+    "Change published to the subscribers"
+
+    def __init__(self, name:str, task_name:str, get_data:Callable[[], Optional[str]]):
+        self.name = name
+        self.task_name = task_name
+        self._get_data = get_data
+        self._message = None
+
+    def encode(self) -> Optional[str]:
+        "Get the event as Server-Sent Event message"
+        # The data is formed once for all subscribers and
+        # as late as possible so that the task state is
+        # updated after logging
+        if self._message is None:
+            data = self._get_data()
+            self._message = f"event: {self.name}\ndata: {data}\n\n" if data is not None else ""
+        return self._message or None
+
+class _Subscription:
+
+    def __init__(self, loop:asyncio.AbstractEventLoop, tasks:List[str]=None, size:int=1000):
+        self.loop = loop
+        self.tasks = set(tasks) if tasks else None
+        self.queue = asyncio.Queue(size)
+
+    def put(self, event:Event):
+        if self.tasks is not None and event.task_name not in self.tasks:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow client, the client should reconnect
+            self.close()
+
+    def close(self):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class EventStream(logging.Handler):
+    """Stream of task changes and new log records
+
+    The stream listens the task logger only when there
+    are subscribers so it costs nothing when idle.
+
+    Parameters
+    ----------
+    session : rocketry.Session
+        Session to publish changes from.
+    queue_size : int
+        Maximum number of events waiting per subscriber.
+        Subscribers falling behind are disconnected.
+    heartbeat : float
+        Seconds between keep-alive comments.
+    """
+
+    def __init__(self, session:Session, queue_size:int=1000, heartbeat:float=15.0):
+        super().__init__()
+        self.session = session
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.subscriptions = set()
+        self.stopped = False
+
+    def emit(self, record:logging.LogRecord):
+        task_name = getattr(record, "task_name", None)
+        action = getattr(record, "action", None)
+        if task_name is None or action is None:
+            return
+        created = record.created
+        self.publish(Event(
+            "log", task_name,
+            lambda: Log(task_name=task_name, action=action, created=created).json(by_alias=True)
+        ))
+        self.publish_task(task_name)
+
+    def publish_task(self, task_name:str):
+        "Publish the state of a task"
+        self.publish(Event("task", task_name, lambda: self._get_task(task_name)))
+
+    def publish(self, event:Event):
+        with self.lock:
+            for sub in self.subscriptions:
+                sub.loop.call_soon_threadsafe(sub.put, event)
+
+    def start(self):
+        "Accept subscribers again after stopping"
+        with self.lock:
+            self.stopped = False
+
+    def stop(self):
+        "End the open streams (ie. so that the server can shut down)"
+        with self.lock:
+            self.stopped = True
+            for sub in self.subscriptions:
+                sub.loop.call_soon_threadsafe(sub.close)
+
+    async def subscribe(self, tasks:List[str]=None) -> AsyncIterator[str]:
+        "Iterate the events as Server-Sent Event messages"
+        sub = _Subscription(asyncio.get_running_loop(), tasks=tasks, size=self.queue_size)
+        if not self._add(sub):
+            return
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                message = event.encode()
+                if message is not None:
+                    yield message
+        finally:
+            self._remove(sub)
+
+    def _get_task(self, task_name:str) -> Optional[str]:
+        try:
+            task = self.session[task_name]
+        except KeyError:
+            return None
+        return TaskModel.from_task(task).json()
+
+    def _add(self, sub:_Subscription) -> bool:
+        with self.lock:
+            if self.stopped:
+                return False
+            if not self.subscriptions:
+                self._get_logger().addHandler(self)
+            self.subscriptions.add(sub)
+            return True
+
+    def _remove(self, sub:_Subscription):
+        with self.lock:
+            self.subscriptions.discard(sub)
+            if not self.subscriptions:
+                self._get_logger().removeHandler(self)
+
+    def _get_logger(self) -> logging.Logger:
+        return logging.getLogger(self.session.config.task_logger_basename)
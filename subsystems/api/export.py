@@ -0,0 +1,55 @@
+import csv
+import io
+import json
+import zlib
+from typing import Iterable, Iterator
+
+def encode_ndjson(records:Iterable, chunk_size:int=1000) -> Iterator[bytes]:
+    "Encode records as newline delimited JSON"
+    lines = []
+    for record in records:
+        lines.append(json.dumps(_to_dict(record), default=str))
+        if len(lines) >= chunk_size:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
+
+def encode_csv(records:Iterable, chunk_size:int=1000) -> Iterator[bytes]:
+    "Encode records as CSV, the columns are from the first record"
+    buffer = io.StringIO()
+    writer = None
+    for i, record in enumerate(records, start=1):
+        row = _to_dict(record)
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        if i % chunk_size == 0:
+            yield _flush(buffer)
+    if buffer.tell():
+        yield _flush(buffer)
+
+def compress_gzip(chunks:Iterable[bytes]) -> Iterator[bytes]:
+    "Compress a stream of bytes to gzip"
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _flush(buffer:io.StringIO) -> bytes:
+    data = buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+def _to_dict(record) -> dict:
+    if isinstance(record, dict):
+        return record
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if not key.startswith("_")
+    }
@@ -0,0 +1,208 @@
+import base64
+import binascii
+import json
+from itertools import islice
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from redbird.oper import between
+from redbird.repos import MemoryRepo, SQLRepo
+from redbird.utils.query import QueryMatcher
+
+# Created and position (index in memory, id in SQL). Records
+# with the same created are ordered by the position so that
+# ties at a page boundary are not skipped.
+Cursor = Tuple[float, int]
+
+class CursorError(ValueError):
+    "Cursor is malformed or used incorrectly"
+
+class LogPage(NamedTuple):
+    "Page of log records, newest first"
+    records: List
+    next: Optional[str] # Cursor to older records
+    prev: Optional[str] # Cursor to newer records
+
+def encode_cursor(created:float, position:int) -> str:
+    raw = json.dumps([created, position], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor:str) -> Cursor:
+    "Turn an opaque cursor back to (created, position)"
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created, position = json.loads(raw)
+        return float(created), int(position)
+    except (TypeError, ValueError, binascii.Error) as exc:
+        raise CursorError(f"Invalid cursor: {cursor!r}") from exc
+
+def read_logs(repo, query:dict, min_created:float=None, max_created:float=None,
+              limit:int=None, after:str=None, before:str=None, buffer=None) -> LogPage:
+    """Read a page of log records newest first
+
+    The cursor 'after' continues to older records and the
+    cursor 'before' to newer records. Limit and order are
+    pushed down to the repository if it supports them.
+    Recent records are read from the buffer if given and
+    it covers the page.
+    """
+    if after is not None and before is not None:
+        raise CursorError("Pass only one of 'after' and 'before'")
+    after = decode_cursor(after) if after is not None else None
+    before = decode_cursor(before) if before is not None else None
+    bounds = (min_created, max_created)
+    n_read = limit + 1 if limit is not None else None
+
+    rows = None
+    if buffer is not None:
+        rows = buffer.read(query, bounds, after=after, before=before, limit=n_read)
+    if rows is None:
+        rows = _iter_repo(repo, query, bounds, after=after, before=before, limit=n_read)
+
+    rows = list(islice(rows, n_read))
+    has_more = limit is not None and len(rows) > limit
+    rows = rows[:limit]
+
+    if before is not None:
+        # Read towards newer records, page is still newest first
+        rows.reverse()
+        prev = _to_cursor(repo, rows[0]) if rows else encode_cursor(*before)
+        next = _to_cursor(repo, rows[-1]) if rows else None
+    else:
+        prev = _to_cursor(repo, rows[0]) if rows else (encode_cursor(*after) if after is not None else None)
+        next = _to_cursor(repo, rows[-1]) if has_more else None
+    return LogPage(records=[record for _, record in rows], next=next, prev=prev)
+
+def iter_logs(repo, query:dict, min_created:float=None, max_created:float=None, chunk_size:int=1000) -> Iterator:
+    "Iterate all matching log records newest first reading a chunk at a time"
+    if not isinstance(repo, (MemoryRepo, SQLRepo)):
+        # Cannot be paged without reading all, iterating
+        # in the order of the repository instead
+        yield from repo.filter_by(**_with_bounds(query, (min_created, max_created))).query()
+        return
+    after = None
+    while True:
+        page = read_logs(repo, query, min_created=min_created, max_created=max_created, limit=chunk_size, after=after)
+        yield from page.records
+        if page.next is None:
+            break
+        after = page.next
+
+def locate_record(repo, record) -> int:
+    "Get position of a record that was just stored to the repository"
+    if not isinstance(repo, MemoryRepo):
+        # Created is the position
+        return -1
+    collection = repo.collection
+    last = len(collection) - 1
+    # Other threads may have logged after the record
+    for position in range(last, max(last - 10, -1), -1):
+        data = collection[position]
+        if all(repo.get_field_value(data, attr) == getattr(record, attr) for attr in ("created", "task_name", "action")):
+            return position
+    return last
+
+def _to_cursor(repo, row) -> str:
+    position, record = row
+    created = repo.get_field_value(record, "created")
+    if position < 0 and isinstance(repo, SQLRepo):
+        # From the buffer, the id is needed to continue
+        position = _find_sql_id(repo, record)
+    return encode_cursor(created, position)
+
+def _get_id_column(repo):
+    return list(repo.model_orm.__table__.primary_key.columns)[0]
+
+def _find_sql_id(repo, record) -> int:
+    id_column = _get_id_column(repo)
+    orm = repo.model_orm
+    qry = (
+        repo.session.query(id_column)
+        .filter(
+            orm.created == repo.get_field_value(record, "created"),
+            orm.task_name == repo.get_field_value(record, "task_name"),
+            orm.action == repo.get_field_value(record, "action"),
+        )
+        .order_by(id_column.desc())
+    )
+    row = qry.first()
+    return row[0] if row is not None else -1
+
+def _iter_repo(repo, query:dict, bounds, after:Cursor=None, before:Cursor=None, limit:int=None) -> Iterator[tuple]:
+    if isinstance(repo, MemoryRepo):
+        return _iter_collection(repo, repo.collection, query, bounds, after=after, before=before)
+    elif isinstance(repo, SQLRepo):
+        return _iter_sql(repo, query, bounds, after=after, before=before, limit=limit)
+    return _iter_any(repo, query, bounds, after=after, before=before)
+
+def _iter_collection(repo, collection, query:dict, bounds, after:Cursor=None, before:Cursor=None) -> Iterator[tuple]:
+    # The collection is assumed to be in the order
+    # the records were logged (oldest first) thus
+    # the position of a record is its index
+    matcher = QueryMatcher(query, value_getter=repo.get_field_value)
+    min_created, max_created = bounds
+    ascending = before is not None
+    if ascending:
+        positions = range(before[1] + 1, len(collection))
+    else:
+        end = min(after[1], len(collection)) if after is not None else len(collection)
+        positions = range(end - 1, -1, -1)
+
+    for position in positions:
+        data = collection[position]
+        created = repo.get_field_value(data, "created")
+        if min_created is not None and created < min_created:
+            if ascending:
+                continue
+            break
+        if max_created is not None and created > max_created:
+            if ascending:
+                break
+            continue
+        if data in matcher:
+            yield position, repo.data_to_item(data)
+
+def _iter_sql(repo, query:dict, bounds, after:Cursor=None, before:Cursor=None, limit:int=None) -> Iterator[tuple]:
+    query = _with_bounds(query, bounds)
+    created = repo.model_orm.created
+    id_column = _get_id_column(repo)
+    qry = repo.session.query(repo.model_orm).filter(repo.filter_by(**query).query_)
+    if before is not None:
+        qry = qry.filter(_keyset_filter(created, id_column, before, newer=True)).order_by(created.asc(), id_column.asc())
+    else:
+        if after is not None:
+            qry = qry.filter(_keyset_filter(created, id_column, after, newer=False))
+        qry = qry.order_by(created.desc(), id_column.desc())
+    if limit is not None:
+        qry = qry.limit(limit)
+    for row in qry:
+        yield getattr(row, id_column.key), repo.data_to_item(row)
+
+def _keyset_filter(created, id_column, cursor:Cursor, newer:bool):
+    import sqlalchemy
+    cursor_created, cursor_id = cursor
+    if cursor_id < 0:
+        # Cursor without id, ties cannot be resolved
+        return created > cursor_created if newer else created < cursor_created
+    if newer:
+        return sqlalchemy.or_(created > cursor_created, sqlalchemy.and_(created == cursor_created, id_column > cursor_id))
+    return sqlalchemy.or_(created < cursor_created, sqlalchemy.and_(created == cursor_created, id_column < cursor_id))
+
+def _iter_any(repo, query:dict, bounds, after:Cursor=None, before:Cursor=None) -> Iterator[tuple]:
+    # Repository cannot order, we need to read all. The
+    # position is the index in the (stable) sorted records
+    # and it breaks the ties of created.
+    records = repo.filter_by(**_with_bounds(query, bounds)).all()
+    records = sorted(records, key=lambda record: repo.get_field_value(record, "created"))
+    rows = [((repo.get_field_value(record, "created"), position), record) for position, record in enumerate(records)]
+    if before is not None:
+        rows = (row for row in rows if row[0] > before)
+    else:
+        rows = (row for row in reversed(rows) if after is None or row[0] < after)
+    for (_, position), record in rows:
+        yield position, record
+
+def _with_bounds(query:dict, bounds) -> dict:
+    min_created, max_created = bounds
+    if min_created is None and max_created is None:
+        return query
+    return dict(query, created=between(min_created, max_created, none_as_open=True))
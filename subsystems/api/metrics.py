@@ -0,0 +1,196 @@
+import datetime
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from rocketry import Session
+
+# Seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)
+
+class Counter:
+    "Prometheus counter"
+    type = "counter"
+
+    def __init__(self, name:str, documentation:str, labels:Sequence[str]=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels:str, amount:float=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            values = list(self.values.items())
+        for labels, value in sorted(values):
+            yield f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}"
+
+class Gauge(Counter):
+    "Prometheus gauge"
+    type = "gauge"
+
+    def dec(self, *labels:str, amount:float=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value:float, *labels:str):
+        with self._lock:
+            self.values[labels] = value
+
+class Histogram:
+    "Prometheus histogram"
+    type = "histogram"
+
+    def __init__(self, name:str, documentation:str, labels:Sequence[str]=(), buckets:Sequence[float]=REQUEST_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Counts per bucket (not cumulative), sum
+        self.values: Dict[tuple, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, *labels:str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self.values.get(labels) or self.values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, *labels:str):
+        "Observe the duration of the block"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        names = self.labels + ("le",)
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self.values.items()]
+        for labels, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {cumulative}"
+
+class Metrics(logging.Handler):
+    """Prometheus metrics of the API and the scheduler
+
+    Request metrics are collected by MetricsMiddleware and
+    the task metrics from the task logs (when attached).
+    """
+
+    def __init__(self, buckets:Sequence[float]=REQUEST_BUCKETS, task_buckets:Sequence[float]=TASK_BUCKETS):
+        super().__init__()
+        self.session = None
+
+        self.requests = Histogram(
+            "subsystems_http_request_duration_seconds", "Duration of HTTP requests",
+            labels=("method", "route", "status"), buckets=buckets
+        )
+        self.requests_in_flight = Gauge("subsystems_http_requests_in_flight", "Number of HTTP requests being served")
+        self.log_queries = Histogram(
+            "subsystems_log_query_duration_seconds", "Duration of queries to the log repository",
+            labels=("endpoint",), buckets=buckets
+        )
+        self.task_actions = Counter("rocketry_task_actions_total", "Number of task log records", labels=("task", "action"))
+        self.task_runtime = Histogram(
+            "rocketry_task_run_duration_seconds", "Duration of finished task runs",
+            labels=("task", "action"), buckets=task_buckets
+        )
+        self.tasks_running = Gauge("rocketry_tasks_running", "Number of running tasks")
+
+    def attach(self, session:Session):
+        "Start following the task logs of the session (if not already)"
+        self.session = session
+        logger = logging.getLogger(session.config.task_logger_basename)
+        if self not in logger.handlers:
+            logger.addHandler(self)
+
+    def detach(self):
+        logging.getLogger(self.session.config.task_logger_basename).removeHandler(self)
+
+    def emit(self, record:logging.LogRecord):
+        task_name = getattr(record, "task_name", None)
+        action = getattr(record, "action", None)
+        if task_name is None or action is None:
+            return
+        self.task_actions.inc(task_name, action)
+        runtime = getattr(record, "runtime", None)
+        if isinstance(runtime, datetime.timedelta):
+            runtime = runtime.total_seconds()
+        if action != "run" and runtime is not None:
+            self.task_runtime.observe(runtime, task_name, action)
+
+    def render(self) -> str:
+        "Render the metrics in Prometheus text format"
+        if self.session is not None:
+            # Cheaper to compute on scrape than to track
+            self.tasks_running.set(sum(1 for task in list(self.session.tasks) if task.is_alive()))
+        metrics = [self.requests, self.requests_in_flight, self.log_queries, self.task_actions, self.task_runtime, self.tasks_running]
+        return "\n".join(line for metric in metrics for line in metric.collect()) + "\n"
+
+class MetricsMiddleware:
+    "ASGI middleware measuring the requests"
+
+    def __init__(self, app, metrics:Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.requests_in_flight.dec()
+            # The router sets the matched route to the scope. The
+            # template is used as the label to limit cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            metrics.requests.observe(duration, scope["method"], route_path, str(status))
+
+def _format_labels(names:Sequence[str], values:Sequence[str]) -> str:
+    if not names:
+        return ""
+    labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + labels + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value:float) -> str:
+    if math.isfinite(value) and value == int(value):
+        return str(int(value))
+    return repr(float(value))
@@ -1,6 +1,10 @@
 import datetime
 from pydantic import BaseModel, Field, validator
-from typing import Optional
+from typing import List, Optional
+try:
+    from typing import Literal
+except ImportError:
+    from typing_extensions import Literal
 
 class TaskModel(BaseModel):
     name: str
@@ -39,24 +43,36 @@ class TaskModel(BaseModel):
         return str(value)
 
     @classmethod
-    def from_task(cls, task):
-        extra_attrs = (
-            "status",
-            "last_run", "last_success", "last_fail", "last_terminate", "last_crash", "last_inaction",
-            "is_running"
-        )
-        attrs = task.dict()
-        attrs.update(
-            {
-                attr: getattr(task, attr)
-                for attr in extra_attrs
-            }
-            
-        )
+    def from_task(cls, task, **attrs):
+        "Create the model from a task, attrs are used as they are"
+        for attr in cls.__fields__:
+            if attr not in attrs and attr != "set_running":
+                attrs[attr] = getattr(task, attr)
         attrs["set_running"] = task.batches != []
         return cls(**attrs)
 
 class Log(BaseModel):
     timestamp: Optional[datetime.datetime] = Field(alias="created")
     task_name: str
-    action: str
\ No newline at end of file
+    action: str
+
+class BulkAction(BaseModel):
+    action: Literal['disable', 'enable', 'terminate', 'run', 'patch']
+    values: Optional[dict] = Field(description="Attributes to set if action is 'patch'")
+
+    # Selector, the task matching any of these are selected
+    tasks: Optional[List[str]] = Field(description="Names of the tasks")
+    pattern: Optional[str] = Field(description="Glob pattern of the task names")
+    status: Optional[List[str]] = Field(description="Latest statuses of the tasks")
+
+class BulkResult(BaseModel):
+    task: str
+    action: str
+    success: bool
+    error: Optional[str]
+
+class LogStat(BaseModel):
+    start: Optional[datetime.datetime]
+    task_name: str
+    action: str
+    count: int
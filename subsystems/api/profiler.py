@@ -0,0 +1,218 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+try:
+    from typing import Literal
+except ImportError:
+    from typing_extensions import Literal
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+if TYPE_CHECKING:
+    from subsystems.api.scheduler import SchedulerThread
+
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+# (function, file, first line)
+Frame = Tuple[str, str, int]
+
+class SamplingProfiler:
+    """Statistical profiler sampling the stacks of threads
+
+    The samples are taken from a separate thread so the
+    profiled code is not instrumented. If multiple threads
+    are sampled, the stacks are rooted to the thread names.
+    """
+
+    def __init__(self, thread_ids:Optional[Sequence[int]]=None, interval:float=0.005):
+        self.thread_ids = list(thread_ids) if thread_ids is not None else [threading.get_ident()]
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="subsystems-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._start
+
+    def _run(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        roots = {
+            thread_id: ((f"thread {names.get(thread_id, thread_id)}", "<thread>", 0),) if len(self.thread_ids) > 1 else ()
+            for thread_id in self.thread_ids
+        }
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[roots[thread_id] + self._get_stack(frame)] += 1
+
+    @staticmethod
+    def _get_stack(frame) -> Tuple[Frame, ...]:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+            frame = frame.f_back
+        # Root first
+        return tuple(reversed(stack))
+
+    def to_collapsed(self) -> str:
+        "Format the samples as collapsed stacks (flamegraph.pl, speedscope)"
+        lines = [
+            ";".join(f"{func} ({file}:{line})" for func, file, line in stack) + f" {count}"
+            for stack, count in self.samples.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name:str="subsystems") -> str:
+        "Format the samples in speedscope's file format"
+        frames: List[dict] = []
+        indexes: Dict[Frame, int] = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.most_common():
+            sample = []
+            for frame in stack:
+                if frame not in indexes:
+                    indexes[frame] = len(frames)
+                    func, file, line = frame
+                    frames.append({"name": func, "file": file, "line": line})
+                sample.append(indexes[frame])
+            samples.append(sample)
+            weights.append(count * self.interval)
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "subsystems",
+            "name": name,
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+        })
+
+class ProfilerRoutes:
+    """Profile the running process on request
+
+    The profilers target the thread of the API's event
+    loop which by default also runs the scheduler. If the
+    scheduler has its own thread (scheduler_thread), the
+    sampling profiler samples it too but cProfile only
+    covers the API's thread.
+
+    A token is required unless allow_local is set. Then
+    clients from loopback addresses are allowed without
+    it, which is not safe behind a reverse proxy on the
+    same host.
+    """
+
+    def __init__(self, token:Optional[str]=None, allow_local:bool=False, max_seconds:float=60, scheduler_thread:Optional['SchedulerThread']=None):
+        if token is None and not allow_local:
+            raise ValueError("Profiler requires a token (or allow_local)")
+        self.scheduler_thread = scheduler_thread
+        self.token = token
+        self.allow_local = allow_local
+        self.max_seconds = max_seconds
+        # Created in the event loop of the app
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def profile(self, request:Request,
+                      seconds:float=Query(10, gt=0),
+                      mode:Literal["sampling", "cprofile"]="sampling",
+                      format:Literal["speedscope", "collapsed", "pstats", "text"]="speedscope",
+                      interval:float=Query(0.005, gt=0)):
+        self._check_access(request)
+        if seconds > self.max_seconds:
+            raise HTTPException(status_code=400, detail=f"Profiling is limited to {self.max_seconds} seconds")
+        if mode == "sampling" and format not in ("speedscope", "collapsed"):
+            raise HTTPException(status_code=400, detail=f"Format {format!r} is not supported by the sampling profiler")
+        if mode == "cprofile" and format not in ("pstats", "text"):
+            raise HTTPException(status_code=400, detail=f"Format {format!r} is not supported by cProfile")
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if self._lock.locked():
+            raise HTTPException(status_code=409, detail="Profiling is already in progress")
+
+        async with self._lock:
+            if mode == "sampling":
+                return await self._profile_sampling(seconds, format, interval)
+            return await self._profile_cprofile(seconds, format)
+
+    async def _profile_sampling(self, seconds:float, format:str, interval:float):
+        thread_ids = [threading.get_ident()]
+        if self.scheduler_thread is not None and self.scheduler_thread.is_alive():
+            thread_ids.append(self.scheduler_thread.thread.ident)
+        profiler = SamplingProfiler(thread_ids=thread_ids, interval=interval)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+        if format == "collapsed":
+            return Response(profiler.to_collapsed(), media_type="text/plain")
+        return Response(
+            profiler.to_speedscope(), media_type="application/json",
+            headers={"Content-Disposition": 'attachment; filename="profile.speedscope.json"'}
+        )
+
+    async def _profile_cprofile(self, seconds:float, format:str):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        if format == "text":
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats()
+            return Response(output.getvalue(), media_type="text/plain")
+        # Same as pstats.Stats.dump_stats
+        return Response(
+            marshal.dumps(profiler.stats), media_type="application/octet-stream",
+            headers={"Content-Disposition": 'attachment; filename="profile.pstats"'}
+        )
+
+    def _check_access(self, request:Request):
+        if self.allow_local:
+            host = request.client.host if request.client is not None else None
+            if host in LOOPBACK_HOSTS:
+                return
+            if self.token is None:
+                raise HTTPException(status_code=403, detail="Profiling is only allowed from localhost")
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), self.token.encode()):
+            raise HTTPException(status_code=403, detail="Invalid profiler token")
+
+def create_profiler_routes(token:Optional[str]=None, allow_local:bool=False, max_seconds:float=60, scheduler_thread:Optional['SchedulerThread']=None, **kwargs):
+    router = APIRouter(**kwargs)
+
+    routes = ProfilerRoutes(token=token, allow_local=allow_local, max_seconds=max_seconds, scheduler_thread=scheduler_thread)
+
+    router.post("/debug/profile", tags=["debug"], include_in_schema=False)(routes.profile)
+    return router
@@ -1,15 +1,30 @@
+from contextlib import nullcontext
+from fnmatch import fnmatchcase
 from typing import List, Optional
 try:
     from typing import Literal
 except ImportError:
     from typing_extensions import Literal
 import time
+import uuid
 
-from fastapi import APIRouter, Query
-from redbird.oper import between, in_, greater_equal
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from redbird.oper import between, in_
 from rocketry import Rocketry
 
-from subsystems.api.models import Log, TaskModel
+from subsystems.api.buffer import LogBuffer
+from subsystems.api.encoding import FastJSONResponse, log_to_dict, record_to_dict
+from subsystems.api.events import EventStream
+from subsystems.api.export import compress_gzip, encode_csv, encode_ndjson
+from subsystems.api.logs import CursorError, iter_logs, read_logs
+from subsystems.api.metrics import Metrics
+from subsystems.api.models import BulkAction, BulkResult, Log, LogStat, TaskModel
+from subsystems.api.scheduler import SchedulerThread
+from subsystems.api.snapshots import TaskSnapshots
+from subsystems.api.stats import LogStats
+from subsystems.api.state import StateVersion, is_not_modified
+from subsystems.utils.assets import accepts_encoding
 
 
 # Session Config
@@ -17,15 +32,38 @@ from subsystems.api.models import Log, TaskModel
 
 class RocketryRoutes:
 
-    def __init__(self, app:Rocketry):
+    def __init__(self, app:Rocketry, log_buffer:Optional[LogBuffer]=None, log_stats:Optional[LogStats]=None, metrics:Optional[Metrics]=None,
+                 scheduler_thread:Optional[SchedulerThread]=None, events:Optional[EventStream]=None, fast_json:bool=False):
         self.app = app
+        # Skip validating and encoding the (trusted) data twice
+        self.fast_json = fast_json
+        self.log_buffer = log_buffer
+        self.log_stats = log_stats
+        self.metrics = metrics
+        # Changes are made in the scheduler's thread if it has one
+        self.scheduler_thread = scheduler_thread
+        self.events = events if events is not None else EventStream(app.session)
+        self.state = StateVersion(app.session)
+        self.state.attach()
+        self.snapshots = TaskSnapshots(self.state)
+        # Versions restart with the process
+        self.nonce = uuid.uuid4().hex[:8]
+
+    def start(self):
+        "Follow the session (again after closing)"
+        self.state.attach()
+        self.events.start()
+
+    def close(self):
+        "Stop following the session"
+        self.events.stop()
+        self.state.detach()
 
     async def get_session_config(self):
         return self.session.config.dict(exclude={"time_func", "func_run_id", "cls_lock"})
 
     async def patch_session_config(self, values:dict):
-        for key, val in values.items():
-            setattr(self.session.config, key, val)
+        await self._call(_set_attrs, self.session.config, values)
 
     # Session Parameters
     # ------------------
@@ -37,10 +75,10 @@ class RocketryRoutes:
         return self.session.parameters[name]
 
     async def put_session_parameter(self, name:str, value):
-        self.session.parameters[name] = value
+        await self._call(self.session.parameters.__setitem__, name, value)
 
     async def delete_session_parameter(self, name:str):
-        del self.session.parameters[name]
+        await self._call(self.session.parameters.__delitem__, name)
 
 
     # Session Actions
@@ -53,19 +91,31 @@ class RocketryRoutes:
     # Task
     # ----
 
-    async def get_tasks(self):
-        return [
-            TaskModel.from_task(task)
-            for task in self.session.tasks
-        ]
+    async def get_tasks(self, response: Response, if_none_match: Optional[str] = Header(default=None)):
+        # Checking the snapshots is cheap if nothing has changed
+        models = self.snapshots.get_all(self.session.tasks)
+        etag = self._get_etag(self.snapshots.version)
+        if is_not_modified(if_none_match, etag):
+            return self._not_modified(etag)
+        if self.fast_json:
+            return self._json_response(b"[" + b",".join(map(self.snapshots.encode, models)) + b"]", etag)
+        self._set_etag(response, etag)
+        return models
+
+    async def get_task(self, task_name:str, response: Response, if_none_match: Optional[str] = Header(default=None)):
+        model = self.snapshots.get(self.session[task_name])
+        etag = self._get_etag(self.snapshots.get_revision(task_name))
+        if is_not_modified(if_none_match, etag):
+            return self._not_modified(etag)
+        if self.fast_json:
+            return self._json_response(self.snapshots.encode(model), etag)
+        self._set_etag(response, etag)
+        return model
 
-    async def get_task(self, task_name:str):
-        return TaskModel.from_task(self.session[task_name])
-        
     async def patch_task(self, task_name:str, values:dict):
         task = self.session[task_name]
-        for attr, val in values.items():
-            setattr(task, attr, val)
+        await self._call(_set_attrs, task, values)
+        self._task_changed(task_name)
 
 
     # Task Actions
@@ -73,47 +123,157 @@ class RocketryRoutes:
 
     async def disable_task(self, task_name:str):
         task = self.session[task_name]
-        task.disabled = True
+        await self._call(setattr, task, "disabled", True)
+        self._task_changed(task_name)
 
     async def enable_task(self, task_name:str):
         task = self.session[task_name]
-        task.disabled = False
+        await self._call(setattr, task, "disabled", False)
+        self._task_changed(task_name)
 
     async def terminate_task(self, task_name:str):
         task = self.session[task_name]
-        task.force_termination = True
+        await self._call(setattr, task, "force_termination", True)
+        self._task_changed(task_name)
 
     async def run_task(self, task_name:str):
         task = self.session[task_name]
-        task.run()
+        await self._call(task.run)
+        self._task_changed(task_name)
+
+
+    async def bulk_tasks(self, actions:List[BulkAction]):
+        results, changed = await self._call(self._apply_bulk, actions)
+        if changed:
+            self.state.bump(*changed)
+            for task_name in changed:
+                self.events.publish_task(task_name)
+        return results
+
+    def _apply_bulk(self, actions:List[BulkAction]):
+        tasks = {task.name: task for task in self.session.tasks}
+        results = []
+        changed = {}
+        for bulk in actions:
+            for task_name in self._select_tasks(bulk, tasks):
+                if task_name not in tasks:
+                    results.append(BulkResult(task=task_name, action=bulk.action, success=False, error=f"Task '{task_name}' not found"))
+                    continue
+                try:
+                    self._apply_action(tasks[task_name], bulk)
+                except Exception as exc:
+                    results.append(BulkResult(task=task_name, action=bulk.action, success=False, error=str(exc)))
+                else:
+                    results.append(BulkResult(task=task_name, action=bulk.action, success=True))
+                    changed[task_name] = None
+        return results, list(changed)
+
+    def _select_tasks(self, bulk:BulkAction, tasks:dict) -> List[str]:
+        names = list(bulk.tasks) if bulk.tasks else []
+        if bulk.pattern is not None:
+            names += sorted(name for name in tasks if fnmatchcase(name, bulk.pattern))
+        if bulk.status is not None:
+            names += sorted(name for name, task in tasks.items() if task.status in bulk.status)
+        return list(dict.fromkeys(names))
+
+    def _apply_action(self, task, bulk:BulkAction):
+        if bulk.action == "disable":
+            task.disabled = True
+        elif bulk.action == "enable":
+            task.disabled = False
+        elif bulk.action == "terminate":
+            task.force_termination = True
+        elif bulk.action == "run":
+            task.run()
+        elif bulk.action == "patch":
+            _set_attrs(task, bulk.values or {})
 
 
     # Logging
     # -------
-    async def get_logs(self, action: Optional[List[Literal['run', 'success', 'fail', 'terminate', 'crash', 'inaction']]] = Query(default=[]),
+    async def get_logs(self, response: Response,
+                            action: Optional[List[Literal['run', 'success', 'fail', 'terminate', 'crash', 'inaction']]] = Query(default=[]),
                             min_created: Optional[int]=Query(default=None), max_created: Optional[int] = Query(default=None),
                             past: Optional[int]=Query(default=None),
                             limit: Optional[int]=Query(default=None),
-                            task: Optional[List[str]] = Query(default=None)):
+                            task: Optional[List[str]] = Query(default=None),
+                            after: Optional[str]=Query(default=None, description="Cursor to continue to older records"),
+                            before: Optional[str]=Query(default=None, description="Cursor to continue to newer records")):
+        filter, created = self._get_log_query(action, min_created, max_created, past, task)
+        repo = self.session.get_repo()
+        try:
+            with self._measure_query("logs"):
+                page = read_logs(
+                    repo, filter,
+                    min_created=created[0], max_created=created[1],
+                    limit=limit, after=after, before=before,
+                    buffer=self.log_buffer
+                )
+        except CursorError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+        headers = {}
+        if page.next is not None:
+            headers["X-Next-Cursor"] = page.next
+        if page.prev is not None:
+            headers["X-Prev-Cursor"] = page.prev
+        if self.fast_json:
+            return FastJSONResponse([log_to_dict(log) for log in page.records], headers=headers)
+        response.headers.update(headers)
+        return [Log(**vars(log)) for log in page.records]
+
+    async def export_logs(self,
+                            action: Optional[List[Literal['run', 'success', 'fail', 'terminate', 'crash', 'inaction']]] = Query(default=[]),
+                            min_created: Optional[int]=Query(default=None), max_created: Optional[int] = Query(default=None),
+                            past: Optional[int]=Query(default=None),
+                            task: Optional[List[str]] = Query(default=None),
+                            format: Literal['ndjson', 'csv'] = Query(default='ndjson'),
+                            accept_encoding: Optional[str] = Header(default=None)):
+        filter, created = self._get_log_query(action, min_created, max_created, past, task)
+        records = iter_logs(self.session.get_repo(), filter, min_created=created[0], max_created=created[1])
+
+        if format == "csv":
+            content, media_type = encode_csv(records), "text/csv"
+        else:
+            content, media_type = encode_ndjson(records), "application/x-ndjson"
+        headers = {"Content-Disposition": f'attachment; filename="logs.{format}"', "Vary": "Accept-Encoding"}
+        if accepts_encoding(accept_encoding, "gzip"):
+            content = compress_gzip(content)
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(content, media_type=media_type, headers=headers)
+
+    async def get_log_stats(self,
+                            action: Optional[List[Literal['run', 'success', 'fail', 'terminate', 'crash', 'inaction']]] = Query(default=[]),
+                            min_created: Optional[int]=Query(default=None), max_created: Optional[int] = Query(default=None),
+                            past: Optional[int]=Query(default=None),
+                            task: Optional[List[str]] = Query(default=None),
+                            bucket: Optional[int] = Query(default=None, description="Length of a bucket in seconds, total if not given")):
+        if self.log_stats is None:
+            raise HTTPException(status_code=404, detail="Log statistics are not enabled")
+        _, created = self._get_log_query(action, min_created, max_created, past, task)
+        try:
+            return self.log_stats.get_counts(
+                tasks=task, actions=action,
+                min_created=created[0], max_created=created[1],
+                bucket=bucket
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    def _get_log_query(self, action, min_created, max_created, past, task):
         filter = {}
         if action:
             filter['action'] = in_(action)
         if (min_created or max_created) and not past:
-            filter['created'] = between(min_created, max_created, none_as_open=True)
+            created = (min_created, max_created)
         elif past:
-            filter['created'] = greater_equal(time.time() - past)
-        
+            created = (time.time() - past, None)
+        else:
+            created = (None, None)
+
         if task:
             filter['task_name'] = in_(task)
-
-        repo = self.session.get_repo()
-        logs = repo.filter_by(**filter).all()
-        if limit:
-            logs = logs[max(len(logs)-limit, 0):]
-        logs = sorted(logs, key=lambda log: log.created, reverse=True)
-        logs = [Log(**vars(log)) for log in logs]
-
-        return logs
+        return filter, created
 
     async def get_task_logs(self, task_name:str,
                             action: Optional[List[Literal['run', 'success', 'fail', 'terminate', 'crash', 'inaction']]] = Query(default=[]),
@@ -124,16 +284,71 @@ class RocketryRoutes:
         if min_created or max_created:
             filter['created'] = between(min_created, max_created, none_as_open=True)
 
-        return self.session[task_name].logger.filter_by(**filter).all()
+        with self._measure_query("task_logs"):
+            records = self.session[task_name].logger.filter_by(**filter).all()
+        if self.fast_json:
+            return FastJSONResponse([record_to_dict(record) for record in records])
+        return records
+
+    # Events
+    # ------
+
+    async def get_events(self, task: Optional[List[str]] = Query(default=None)):
+        return StreamingResponse(
+            self.events.subscribe(tasks=task),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache"}
+        )
+
+    async def _call(self, func, *args):
+        if self.scheduler_thread is None:
+            return func(*args)
+        return await self.scheduler_thread.call(func, *args)
+
+    def _measure_query(self, endpoint:str):
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.log_queries.time(endpoint)
+
+    def _task_changed(self, task_name:str):
+        self.state.bump(task_name)
+        self.events.publish_task(task_name)
+
+    def _get_etag(self, version:int) -> str:
+        return f'W/"{self.nonce}-{version}"'
+
+    def _set_etag(self, response:Response, etag:Optional[str]):
+        if etag is not None:
+            response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+
+    def _json_response(self, body:bytes, etag:Optional[str]) -> Response:
+        response = Response(body, media_type="application/json")
+        self._set_etag(response, etag)
+        return response
+
+    def _not_modified(self, etag:str) -> Response:
+        response = Response(status_code=304)
+        self._set_etag(response, etag)
+        return response
 
     @property
     def session(self):
         return self.app.session
 
-def create_rocketry_routes(app:Rocketry, **kwargs):
+def _set_attrs(obj, values:dict):
+    for attr, val in values.items():
+        setattr(obj, attr, val)
+
+def create_rocketry_routes(app:Rocketry, log_buffer:Optional[LogBuffer]=None, log_stats:Optional[LogStats]=None, metrics:Optional[Metrics]=None,
+                           scheduler_thread:Optional[SchedulerThread]=None, events:Optional[EventStream]=None, fast_json:bool=False, **kwargs):
+    if fast_json:
+        kwargs.setdefault("default_response_class", FastJSONResponse)
     router = APIRouter(**kwargs)
 
-    routes = RocketryRoutes(app)
+    routes = RocketryRoutes(app, log_buffer=log_buffer, log_stats=log_stats, metrics=metrics, scheduler_thread=scheduler_thread, events=events, fast_json=fast_json)
+    router.add_event_handler("startup", routes.start)
+    router.add_event_handler("shutdown", routes.close)
 
     router.get("/session/config", tags=["config"])(routes.get_session_config)
     router.patch("/session/config", tags=["config"])(routes.patch_session_config)
@@ -148,12 +363,17 @@ def create_rocketry_routes(app:Rocketry, **kwargs):
     router.get("/tasks/{task_name}", response_model=TaskModel, tags=["task"])(routes.get_task)
     router.patch("/tasks/{task_name}", tags=["task"])(routes.patch_task)
 
+    router.post("/tasks/_bulk", response_model=List[BulkResult], tags=["task"])(routes.bulk_tasks)
     router.post("/tasks/{task_name}/disable", tags=["task"])(routes.disable_task)
     router.post("/tasks/{task_name}/enable", tags=["task"])(routes.enable_task)
     router.post("/tasks/{task_name}/terminate", tags=["task"])(routes.terminate_task)
     router.post("/tasks/{task_name}/run", tags=["task"])(routes.run_task)
 
     router.get("/logs", tags=["logs"])(routes.get_logs)
+    router.get("/logs/export", tags=["logs"])(routes.export_logs)
+    router.get("/logs/stats", response_model=List[LogStat], tags=["logs"])(routes.get_log_stats)
     router.post("/task/{task_name}/logs", tags=["task", "logs"])(routes.get_task_logs)
 
+    router.get("/events", tags=["events"])(routes.get_events)
+
     return router
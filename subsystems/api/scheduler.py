@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+
+from rocketry import Rocketry
+
+logger = logging.getLogger(__name__)
+
+class SchedulerThread:
+    """Run the scheduler in a thread with its own event loop
+
+    The API and the scheduler do not then compete of the
+    same event loop. Changes to the session should be made
+    via ``call`` so that they run in the scheduler's loop
+    between its cycles.
+    """
+
+    def __init__(self, scheduler:Rocketry, name:str="rocketry-scheduler"):
+        self.scheduler = scheduler
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.exception: Optional[BaseException] = None
+        self._ready = threading.Event()
+
+    def start(self):
+        "Start the scheduler and wait for its loop to run"
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except BaseException as exc:
+            self.exception = exc
+            logger.exception("Scheduler crashed")
+        finally:
+            self._ready.set()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._ready.set()
+        try:
+            await self.scheduler.serve()
+        finally:
+            self.loop = None
+
+    async def call(self, func:Callable, *args):
+        "Call a function in the scheduler's thread and wait for the result"
+        loop = self.loop
+        if loop is None or not self.is_alive():
+            # Scheduler is not running, nothing to race with
+            return func(*args)
+        async def run():
+            return func(*args)
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(run(), loop))
+
+    async def join(self, timeout:Optional[float]=None) -> bool:
+        "Wait for the scheduler to finish, return whether it did"
+        if self.thread is None:
+            return True
+        await asyncio.get_running_loop().run_in_executor(None, self.thread.join, timeout)
+        return not self.thread.is_alive()
+
+    def is_alive(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
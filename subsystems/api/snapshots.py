@@ -0,0 +1,304 @@
+import asyncio
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from rocketry import Session
+from rocketry.core import Task
+
+from subsystems.api.encoding import dumps
+from subsystems.api.models import TaskModel
+from subsystems.api.state import StateVersion
+
+# Attributes of TaskModel that may change without a log record
+# or an API call, or are set by Rocketry after logging. These
+# are cheap to read.
+_PLAIN_ATTRS = (
+    "description", "priority", "timeout", "permanent", "multilaunch",
+    "disabled", "force_termination", "force_run", "status",
+    "_last_run", "_last_success", "_last_fail", "_last_terminate", "_last_inaction", "_last_crash",
+)
+
+class _Snapshot(NamedTuple):
+    task: Task
+    key: tuple
+    start_cond: object
+    end_cond: object
+    model: TaskModel
+    # Version of the snapshots when this was built
+    revision: int
+
+class TaskSnapshots:
+    """Cache of the TaskModels of a session
+
+    A snapshot of a task is rebuilt only if the version
+    of the task has changed (new log record or an action
+    from the API) or any of its plain attributes or
+    conditions have changed.
+
+    The version is bumped when any snapshot is rebuilt or
+    a task is removed. As it follows the actual state of
+    the tasks, it can be used as an ETag.
+    """
+
+    def __init__(self, state:StateVersion):
+        self.state = state
+        self.version = 0
+        self._snapshots: Dict[str, _Snapshot] = {}
+        self._encoded: Dict[str, Tuple[TaskModel, bytes]] = {}
+
+    def get(self, task:Task) -> TaskModel:
+        "Get snapshot of a task"
+        model, changed = self._update(task, self.version + 1)
+        if changed:
+            self.version += 1
+        return model
+
+    def get_all(self, tasks) -> List[TaskModel]:
+        "Get snapshots of tasks and forget removed tasks"
+        models = []
+        changed = False
+        for task in tasks:
+            model, task_changed = self._update(task, self.version + 1)
+            models.append(model)
+            changed = changed or task_changed
+        if len(self._snapshots) > len(models):
+            names = {model.name for model in models}
+            for name in set(self._snapshots) - names:
+                del self._snapshots[name]
+                self._encoded.pop(name, None)
+                changed = True
+        if changed:
+            # Once per a change of the state
+            self.version += 1
+        return models
+
+    def get_revision(self, task_name:str) -> int:
+        "Get the version when the snapshot of a task was built"
+        return self._snapshots[task_name].revision
+
+    def _update(self, task:Task, revision:int) -> Tuple[TaskModel, bool]:
+        key = self._get_key(task)
+        start_cond, end_cond = task.start_cond, task.end_cond
+        snapshot = self._snapshots.get(task.name)
+        if snapshot is None or snapshot.task is not task:
+            snapshot = None
+        elif snapshot.key == key and snapshot.start_cond is start_cond and snapshot.end_cond is end_cond:
+            return snapshot.model, False
+
+        attrs = {}
+        if snapshot is not None:
+            # Rendering conditions can be slow
+            if snapshot.start_cond is start_cond:
+                attrs["start_cond"] = snapshot.model.start_cond
+            if snapshot.end_cond is end_cond:
+                attrs["end_cond"] = snapshot.model.end_cond
+        model = TaskModel.from_task(task, **attrs)
+        self._snapshots[task.name] = _Snapshot(task, key, start_cond, end_cond, model, revision)
+        return model, True
+
+    def encode(self, model:TaskModel) -> bytes:
+        "Get the snapshot as JSON (encoded once per snapshot)"
+        cached = self._encoded.get(model.name)
+        if cached is not None and cached[0] is model:
+            return cached[1]
+        encoded = dumps(model.dict(by_alias=True))
+        self._encoded[model.name] = (model, encoded)
+        return encoded
+
+    def _get_key(self, task:Task) -> tuple:
+        # The version is read first so that changes
+        # during building the model are not missed
+        version = self.state.task_versions.get(task.name, 0)
+        # Batches may be modified in place
+        batches = [dict(batch) for batch in task.batches]
+        return (version, batches, *(getattr(task, attr, None) for attr in _PLAIN_ATTRS))
+
+# Magic, version, length of the tasks array and the
+# heartbeat (Unix time). The array is followed by the
+# index (JSON).
+SNAPSHOT_HEADER = struct.Struct("!8sQQd")
+SNAPSHOT_MAGIC = b"SSTASKS2"
+HEARTBEAT = struct.Struct("!d")
+HEARTBEAT_OFFSET = SNAPSHOT_HEADER.size - HEARTBEAT.size
+
+class SnapshotPublisher:
+    """Publish the TaskModels of a session to a file
+
+    The file has the JSON array of the tasks (as returned
+    by /tasks) and an index of the position of each task
+    in it. The file is replaced atomically so readers
+    (other processes) can map it to memory and read it
+    without locking. Put it in /dev/shm to avoid disk IO.
+
+    The heartbeat in the header is refreshed in place every
+    interval so readers can tell if the publisher (or its
+    event loop) has stopped.
+    """
+
+    def __init__(self, session:Session, path:str, interval:float=0.1):
+        self.session = session
+        self.path = path
+        self.interval = interval
+        self.state = StateVersion(session)
+        self.snapshots = TaskSnapshots(self.state)
+        self.version = 0
+        # Readers may outlive this publisher
+        self.generation = uuid.uuid4().hex[:8]
+        self._published: Optional[List[TaskModel]] = None
+        self._task = None
+
+    def start(self):
+        self.state.attach()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.state.detach()
+        if os.path.exists(self.path):
+            # Stale data is worse than none
+            os.unlink(self.path)
+
+    async def _run(self):
+        while True:
+            if not self.publish():
+                self.beat()
+            await asyncio.sleep(self.interval)
+
+    def beat(self):
+        "Mark the published snapshot still current"
+        try:
+            with open(self.path, "r+b") as file:
+                file.seek(HEARTBEAT_OFFSET)
+                file.write(HEARTBEAT.pack(time.time()))
+        except FileNotFoundError:
+            # Removed by someone else, publish again
+            self._published = None
+
+    def publish(self) -> bool:
+        "Write the snapshot if a task has changed"
+        models = self.snapshots.get_all(list(self.session.tasks))
+        published = self._published
+        if published is not None and len(published) == len(models) and all(a is b for a, b in zip(published, models)):
+            return False
+
+        parts = []
+        index = {}
+        position = 1
+        for model in models:
+            encoded = self.snapshots.encode(model)
+            if parts:
+                position += 1
+            index[model.name] = (position, position + len(encoded))
+            position += len(encoded)
+            parts.append(encoded)
+        body = b"[" + b",".join(parts) + b"]"
+
+        self.version += 1
+        meta = json.dumps({"etag": f'W/"{self.generation}-{self.version}"', "interval": self.interval, "tasks": index}).encode()
+        self._write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, self.version, len(body), time.time()) + body + meta)
+        self._published = models
+        return True
+
+    def _write(self, content:bytes):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tasks-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+class Snapshot(NamedTuple):
+    "Published tasks mapped to memory"
+    version: int
+    etag: str
+    body: memoryview
+    index: Dict[str, Tuple[int, int]]
+    # Publishing interval (seconds)
+    interval: float
+    heartbeat_view: memoryview
+
+    @property
+    def heartbeat(self) -> float:
+        "Time (Unix) the publisher last confirmed the snapshot"
+        # Read from the mapping as it is updated in place
+        return HEARTBEAT.unpack(self.heartbeat_view)[0]
+
+    def get_task(self, name:str) -> Optional[memoryview]:
+        position = self.index.get(name)
+        if position is None:
+            return None
+        return self.body[position[0]:position[1]]
+
+class SnapshotReader:
+    """Read the snapshots published by SnapshotPublisher
+
+    The file is mapped again only when it is replaced.
+    The returned views point to the mapped memory so
+    they are not copied.
+
+    Parameters
+    ----------
+    path : str
+        Path of the published file.
+    stale_intervals : float
+        Number of publishing intervals without a heartbeat
+        after which the snapshot is considered stale.
+    """
+
+    def __init__(self, path:str, stale_intervals:float=5):
+        self.path = path
+        self.stale_intervals = stale_intervals
+        self._key = None
+        self._snapshot: Optional[Snapshot] = None
+
+    def get(self) -> Optional[Snapshot]:
+        "Get the latest snapshot or None if not published or stale"
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._key = self._snapshot = None
+            return None
+        # Heartbeats change the modification time. The inode
+        # cannot be reused while the old file is mapped.
+        key = (stat.st_dev, stat.st_ino, stat.st_size)
+        if key != self._key:
+            self._snapshot = self._load()
+            self._key = key
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - snapshot.heartbeat > snapshot.interval * self.stale_intervals:
+            # Publisher is not running or is blocked
+            return None
+        return snapshot
+
+    def _load(self) -> Optional[Snapshot]:
+        try:
+            with open(self.path, "rb") as file:
+                # The mapping stays valid after the file is replaced
+                memory = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (FileNotFoundError, ValueError):
+            return None
+        magic, version, length, _ = SNAPSHOT_HEADER.unpack(memory[:SNAPSHOT_HEADER.size])
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"Not a task snapshot: {self.path}")
+        start = SNAPSHOT_HEADER.size
+        meta = json.loads(bytes(memory[start + length:]))
+        index = {name: tuple(position) for name, position in meta["tasks"].items()}
+        return Snapshot(
+            version=version, etag=meta["etag"], body=memory[start:start + length], index=index,
+            interval=meta["interval"], heartbeat_view=memory[HEARTBEAT_OFFSET:start],
+        )
@@ -0,0 +1,59 @@
+import logging
+from typing import Dict, Optional
+
+from rocketry import Session
+
+class StateVersion(logging.Handler):
+    """Versions of the tasks in a session
+
+    The version of a task is bumped on every new log record
+    of it and by the API on task actions and patches. These
+    are changes that cannot be seen from the cheap attributes
+    of the task (see subsystems.api.snapshots).
+    """
+
+    def __init__(self, session:Session):
+        super().__init__()
+        self.session = session
+        self.task_versions: Dict[str, int] = {}
+        self._detached = False
+
+    def attach(self):
+        "Start following the task logs of the session (if not already)"
+        logger = logging.getLogger(self.session.config.task_logger_basename)
+        if self in logger.handlers:
+            return
+        if self._detached:
+            # The tasks may have changed while detached
+            self.bump(*(task.name for task in self.session.tasks))
+            self._detached = False
+        logger.addHandler(self)
+
+    def detach(self):
+        logging.getLogger(self.session.config.task_logger_basename).removeHandler(self)
+        self._detached = True
+
+    def emit(self, record:logging.LogRecord):
+        task_name = getattr(record, "task_name", None)
+        if task_name is not None:
+            self._bump(task_name)
+
+    def bump(self, *task_names:str):
+        "Mark that the state (of tasks) has changed"
+        with self.lock:
+            self._bump(*task_names)
+
+    def _bump(self, *task_names:str):
+        for task_name in task_names:
+            self.task_versions[task_name] = self.task_versions.get(task_name, 0) + 1
+
+def is_not_modified(if_none_match:str, etag:Optional[str]) -> bool:
+    "Check whether If-None-Match header matches the ETag"
+    if not if_none_match or etag is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison
+    return "*" in tags or _strip_weak(etag) in {_strip_weak(tag) for tag in tags}
+
+def _strip_weak(tag:str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from typing import Dict, List, Optional
+
+from rocketry import Session
+
+from subsystems.api.logs import iter_logs
+
+class LogStats(logging.Handler):
+    """Counts of task log records per task, action and
+    time bucket
+
+    The counts are updated from the task logger as the
+    records are logged thus reading them does not touch
+    the log repository. Only the latest buckets are kept.
+
+    Parameters
+    ----------
+    bucket_size : float
+        Length of a bucket in seconds.
+    retention : int
+        Number of buckets to keep.
+    backfill : bool
+        Whether to count the records already in the repo
+        (within the retention). They are read on the first
+        request of the counts.
+    backfill_limit : int, optional
+        Maximum number of records to backfill (newest first).
+    """
+
+    def __init__(self, bucket_size:float=300, retention:int=288, backfill:bool=True, backfill_limit:Optional[int]=100_000):
+        super().__init__()
+        self.bucket_size = bucket_size
+        self.retention = retention
+        self.backfill = backfill
+        self.backfill_limit = backfill_limit
+
+        self.session = None
+        self.buckets: Dict[int, Counter] = {}
+        self._attached_at = None
+        self._backfill_lock = threading.Lock()
+
+    def attach(self, session:Session):
+        "Start counting the task logs of the session (if not already)"
+        logger = logging.getLogger(session.config.task_logger_basename)
+        if self in logger.handlers:
+            return
+        with self._backfill_lock, self.lock:
+            # Records logged while detached are not counted
+            # (but are backfilled if enabled)
+            self.session = session
+            self.buckets = {}
+            self._attached_at = time.time() if self.backfill else None
+        logger.addHandler(self)
+
+    def detach(self):
+        logging.getLogger(self.session.config.task_logger_basename).removeHandler(self)
+
+    def _backfill(self):
+        # Records logged before attaching, read lazily so
+        # that starting (or a dry run) does not scan the repo
+        with self._backfill_lock:
+            max_created = self._attached_at
+            if max_created is None:
+                return
+            min_created = max_created - self.bucket_size * self.retention
+            records = iter_logs(self.session.get_repo(), {}, min_created=min_created, max_created=max_created)
+            for record in islice(records, self.backfill_limit):
+                with self.lock:
+                    self._add(record.task_name, record.action, record.created)
+            self._attached_at = None
+
+    def emit(self, record:logging.LogRecord):
+        task_name = getattr(record, "task_name", None)
+        action = getattr(record, "action", None)
+        if task_name is not None and action is not None:
+            self._add(task_name, action, record.created)
+
+    def _add(self, task_name:str, action:str, created:float):
+        index = int(created // self.bucket_size)
+        counts = self.buckets.get(index)
+        if counts is None:
+            counts = self.buckets[index] = Counter()
+            # Forget the buckets out of the retention
+            min_index = max(self.buckets) - self.retention + 1
+            for old in [key for key in self.buckets if key < min_index]:
+                del self.buckets[old]
+            if index < min_index:
+                return
+        counts[(task_name, action)] += 1
+
+    def get_counts(self, tasks:List[str]=None, actions:List[str]=None,
+                   min_created:float=None, max_created:float=None, bucket:Optional[float]=None) -> List[dict]:
+        """Get counts per task, action and bucket
+
+        The buckets are combined to the given bucket length
+        (multiple of bucket_size) or to a total if not given.
+        Time limits are applied with the precision of
+        bucket_size.
+        """
+        if bucket is not None and (bucket < self.bucket_size or bucket % self.bucket_size):
+            raise ValueError(f"Bucket must be a multiple of {self.bucket_size}")
+        if self._attached_at is not None:
+            self._backfill()
+        tasks = set(tasks) if tasks else None
+        actions = set(actions) if actions else None
+        min_index = int(min_created // self.bucket_size) if min_created is not None else None
+        max_index = int(max_created // self.bucket_size) if max_created is not None else None
+
+        totals = Counter()
+        with self.lock:
+            for index, counts in self.buckets.items():
+                if (min_index is not None and index < min_index) or (max_index is not None and index > max_index):
+                    continue
+                start = (index * self.bucket_size // bucket) * bucket if bucket is not None else None
+                for (task_name, action), count in counts.items():
+                    if (tasks is None or task_name in tasks) and (actions is None or action in actions):
+                        totals[(start, task_name, action)] += count
+        return [
+            {"start": start, "task_name": task_name, "action": action, "count": count}
+            for (start, task_name, action), count in sorted(totals.items(), key=lambda item: (item[0][0] or 0, item[0][1], item[0][2]))
+        ]
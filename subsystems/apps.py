@@ -1,51 +1,83 @@
 import asyncio
+import json
+import logging
 from typing import TYPE_CHECKING, Dict, Optional, Union
 from pathlib import Path
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException
-from rocketry import Rocketry
 from subsystems.config import InstanceConfig
 
+from subsystems.utils.assets import Asset, AssetCache
 from subsystems.utils.modules import load_instance
 from subsystems.utils.server import _disable_signals
-from .api.router import create_rocketry_routes
 
+# Rocketry and the API are imported only by AutoAPI
+# so that StaticApp starts fast
 if TYPE_CHECKING:
+    from rocketry import Rocketry
     from subsystems.systems import Server
 
+logger = logging.getLogger(__name__)
+
 class StaticApp(FastAPI):
+    """App serving a single page app and its static files
+
+    The index and the custom routes are encoded on
+    creation. If cache_assets is true (or options of
+    AssetCache), also the static files are read to memory
+    (with compressed variants).
+    """
 
-    def __init__(self, *args, path:Union[str, Path], static_path:Union[str, Path]=None, static_route:str="/static", custom_routes=None, **kwargs):
+    def __init__(self, *args, path:Union[str, Path], static_path:Union[str, Path]=None, static_route:str="/static", custom_routes=None,
+                 cache_assets:Union[bool, dict]=False, **kwargs):
         super().__init__(*args, **kwargs)
         self.static_path = static_path
         self.content = Path(path).read_text()
         self.static_route = static_route
         self.custom_routes = custom_routes if custom_routes is not None else {}
+        self.index = Asset(self.content.encode("utf-8"), media_type="text/html; charset=utf-8")
+        self.custom_assets = {route: self._encode_route(content) for route, content in self.custom_routes.items()}
+        self.assets = self._load_assets(cache_assets if isinstance(cache_assets, dict) else {}) if cache_assets else None
 
         self._set_prebuilt_routes()
 
+    def _load_assets(self, options:dict) -> AssetCache:
+        assets = AssetCache(self.static_path, **options)
+        assets.load()
+        return assets
+
+    def _encode_route(self, content) -> Asset:
+        if isinstance(content, str):
+            return Asset(content.encode("utf-8"), media_type="text/html; charset=utf-8")
+        # Same as JSONResponse
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+        return Asset(body.encode("utf-8"), media_type="application/json")
+
     def _set_prebuilt_routes(self):
         static = StaticFiles(directory=self.static_path)
         
         @self.get("/")
         async def get_root(request: Request):
-            return HTMLResponse(self.content)
+            return self.index.get_response(request)
 
         @self.get("/{full_path:path}")
         async def get_page(request: Request, full_path: str=None):
             #return RedirectResponse(url="/index.html")
-            if full_path in self.custom_routes:
-                content = self.custom_routes[full_path]
-                return HTMLResponse(content) if isinstance(content, str) else JSONResponse(content)
+            custom = self.custom_assets.get(full_path)
+            if custom is not None:
+                return custom.get_response(request)
+            if self.assets is not None and full_path not in self.assets.skipped:
+                # Unknown paths are routes of the app
+                asset = self.assets.get(full_path) or self.index
+                return asset.get_response(request)
             try:
                 static_resp = await static.get_response(full_path, request.scope)
             except HTTPException as exc:
                 if exc.status_code == 404:
                     # We return the app and hope the path is found there
-                    return HTMLResponse(self.content)
+                    return self.index.get_response(request)
                 raise
             else:
                 return static_resp
@@ -54,9 +86,41 @@ class StaticApp(FastAPI):
 class AutoAPI(FastAPI):
     arg_server = '__server__'
 
-    def __init__(self, scheduler:Rocketry, origins=None, route_config=None, **kwargs):
+    def __init__(self, scheduler:'Rocketry', origins=None, route_config=None, log_buffer:Union[bool, dict]=None, log_stats:Union[bool, dict]=None,
+                 metrics:Union[bool, dict]=None, shutdown_timeout:Optional[float]=30, terminate_timeout:Optional[float]=5, scheduler_mode:str="loop",
+                 control_socket:Optional[str]=None, task_snapshot:Union[str, dict]=None, fast_json:bool=False, **kwargs):
 
         super().__init__(scheduler=scheduler, **kwargs)
+        # Seconds to wait the running tasks to finish on shutdown
+        # and then the terminated tasks to stop
+        self.shutdown_timeout = shutdown_timeout
+        self.terminate_timeout = terminate_timeout
+        self.terminated_tasks = []
+        self._scheduler_task = None
+        # Scheduler runs in the API's loop or in its own thread
+        if scheduler_mode not in ("loop", "thread"):
+            raise ValueError(f"Invalid scheduler mode: {scheduler_mode!r}")
+        self.scheduler_mode = scheduler_mode
+        self.fast_json = fast_json
+        from .api.scheduler import SchedulerThread
+        self.scheduler_thread = SchedulerThread(scheduler) if scheduler_mode == "thread" else None
+        # API workers (ProxyAPI) connect to this
+        from .api.control import ControlServer
+        self.control_server = ControlServer(self, control_socket) if control_socket is not None else None
+        from .api.snapshots import SnapshotPublisher
+        if isinstance(task_snapshot, str):
+            task_snapshot = {"path": task_snapshot}
+        self.snapshot_publisher = SnapshotPublisher(scheduler.session, **task_snapshot) if task_snapshot is not None else None
+        from .api.events import EventStream
+        self.events = EventStream(scheduler.session)
+        from .api.buffer import LogBuffer
+        from .api.metrics import Metrics
+        from .api.stats import LogStats
+        self.log_buffer = self._create_log_handler(LogBuffer, scheduler, log_buffer)
+        self.log_stats = self._create_log_handler(LogStats, scheduler, log_stats)
+        self.metrics = self._create_log_handler(Metrics, scheduler, metrics)
+        if self.metrics is not None:
+            self._set_metrics_route()
         self._set_events(scheduler)
         self._set_prebuilt_routes(scheduler, route_config)
 
@@ -64,18 +128,89 @@ class AutoAPI(FastAPI):
             self.add_origins(origins)
 
     def _set_prebuilt_routes(self, scheduler, config):
-        if config is None:
-            config = {}
-        self.include_router(create_rocketry_routes(scheduler), **config)
+        config = dict(config) if config is not None else {}
+        # Debug routes are opt-in
+        profiler = config.pop("profiler", None)
+        from .api.router import create_rocketry_routes
+        self.include_router(create_rocketry_routes(scheduler, log_buffer=self.log_buffer, log_stats=self.log_stats, metrics=self.metrics, scheduler_thread=self.scheduler_thread, events=self.events, fast_json=self.fast_json), **config)
+        if profiler is not None and profiler is not False:
+            from .api.profiler import create_profiler_routes
+            profiler = profiler if isinstance(profiler, dict) else {}
+            self.include_router(create_profiler_routes(**profiler, scheduler_thread=self.scheduler_thread), **config)
+
+    def _set_metrics_route(self):
+        from .api.metrics import MetricsMiddleware
+        self.add_middleware(MetricsMiddleware, metrics=self.metrics)
+
+        @self.get("/metrics", include_in_schema=False)
+        async def get_metrics():
+            return Response(self.metrics.render(), media_type="text/plain; version=0.0.4")
+
+    def _create_log_handler(self, cls, scheduler, config):
+        if config is None or config is False:
+            return None
+        handler = cls(**config) if isinstance(config, dict) else cls()
+        handler.attach(scheduler.session)
+        return handler
 
     def _set_events(self, scheduler):
         @self.on_event("startup")
         async def start():
-            asyncio.create_task(scheduler.serve())
+            # Detached on shutdown
+            for handler in (self.log_buffer, self.log_stats, self.metrics):
+                if handler is not None:
+                    handler.attach(scheduler.session)
+            if self.scheduler_thread is not None:
+                self.scheduler_thread.start()
+            else:
+                self._scheduler_task = asyncio.create_task(scheduler.serve())
+            if self.snapshot_publisher is not None:
+                self.snapshot_publisher.start()
+            if self.control_server is not None:
+                await self.control_server.start()
 
         @self.on_event("shutdown")
         async def shutdown():
-            scheduler.session.shut_down()
+            self.close_streams()
+            if self.control_server is not None:
+                await self.control_server.close()
+            if self.snapshot_publisher is not None:
+                await self.snapshot_publisher.stop()
+            await self._shut_down_scheduler(scheduler)
+            for handler in (self.log_buffer, self.log_stats, self.metrics):
+                if handler is not None:
+                    handler.detach()
+
+    async def _shut_down_scheduler(self, scheduler):
+        session = scheduler.session
+        session.shut_down()
+        if self.scheduler_thread is not None:
+            if not await self.scheduler_thread.join(self.shutdown_timeout):
+                self._terminate_tasks(session)
+                if not await self.scheduler_thread.join(self.terminate_timeout):
+                    # The thread is a daemon
+                    logger.warning(f"Scheduler did not stop in {self.terminate_timeout} seconds after terminating, abandoning it")
+            return
+        scheduler_task = self._scheduler_task
+        if scheduler_task is None:
+            return
+        done, _ = await asyncio.wait({scheduler_task}, timeout=self.shutdown_timeout)
+        if not done:
+            self._terminate_tasks(session)
+            done, _ = await asyncio.wait({scheduler_task}, timeout=self.terminate_timeout)
+            if not done:
+                logger.warning(f"Scheduler did not stop in {self.terminate_timeout} seconds after terminating, cancelling it")
+                scheduler_task.cancel()
+
+    def _terminate_tasks(self, session):
+        self.terminated_tasks = sorted(rocketry_task.name for rocketry_task in session.tasks if rocketry_task.is_alive())
+        logger.warning(f"Tasks did not finish in {self.shutdown_timeout} seconds, terminating: {', '.join(self.terminated_tasks)}")
+        for task_name in self.terminated_tasks:
+            session[task_name].force_termination = True
+
+    def close_streams(self):
+        "End the open event streams so that the server can drain"
+        self.events.stop()
 
     def add_server(self, serv):
         self.extra["scheduler"].params(**{self.arg_server: serv})
@@ -88,6 +223,7 @@ class AutoAPI(FastAPI):
                 allow_credentials=True,
                 allow_methods=["*"],
                 allow_headers=["*"],
+                expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],
             )
 
     @classmethod
@@ -96,3 +232,39 @@ class AutoAPI(FastAPI):
         if sched is not None:
             kwargs['scheduler'] = InstanceConfig(**sched).create()
         return cls(**kwargs)
+
+
+class ProxyAPI(FastAPI):
+    """Stateless API forwarding to the process owning the scheduler
+
+    The scheduler process runs AutoAPI with a control socket.
+    Any number of ProxyAPI workers can serve its routes without
+    running the tasks themselves. Routes not defined here are
+    forwarded through pooled connections to the control socket.
+    If the scheduler process publishes a task snapshot, the
+    tasks are read from it instead as long as its heartbeat
+    is recent.
+    """
+
+    def __init__(self, control_socket:str, origins=None, pool_size:int=10, task_snapshot:Union[str, dict]=None, **kwargs):
+        # The docs of the scheduler process are forwarded
+        kwargs.setdefault("openapi_url", None)
+        super().__init__(**kwargs)
+        from .api.control import ControlClient, ControlProxy, SnapshotProxy
+        from .api.snapshots import SnapshotReader
+        self.control_client = ControlClient(control_socket, pool_size=pool_size)
+        self.router.default = ControlProxy(self.control_client)
+        if task_snapshot is not None:
+            # Tasks are read from the file published by the scheduler process
+            if isinstance(task_snapshot, str):
+                task_snapshot = {"path": task_snapshot}
+            self.router.default = SnapshotProxy(SnapshotReader(**task_snapshot), self.router.default)
+
+        @self.on_event("shutdown")
+        async def shutdown():
+            await self.control_client.close()
+
+        if origins:
+            self.add_origins(origins)
+
+    add_origins = AutoAPI.add_origins
@@ -1,25 +1,44 @@
 
-import asyncio
-import importlib
+from contextlib import nullcontext
+from functools import lru_cache, partial
+import hashlib
+import json
+import os
 from pathlib import Path
-from typing import Dict, List, Optional
+import sys
+import tempfile
+from typing import TYPE_CHECKING, Dict, List, Optional
 
-import yaml
-from pydantic import BaseModel, Field, Extra
-from jinja2 import Environment
+from pydantic import BaseModel, Field, Extra, ValidationError, VERSION as PYDANTIC_VERSION
 
 from subsystems.utils.modules import load_instance
-from .systems import Subsystems
-from .servers import create_server, get_server_class, DummyServer
+from subsystems.utils.timing import Timeline
+from subsystems._version import __version__
+
+# Servers, Jinja and YAML are imported only when needed
+# to keep the CLI fast to start
+if TYPE_CHECKING:
+    from jinja2 import Environment
+    from .systems import Subsystems
 
 ROOT = Path(__file__).parent
 PATH_APP = ROOT / "app"
 ROOT_TEMPLATES = ROOT / "templates"
+# Number of configs kept in the cache
+MAX_CACHE_ENTRIES = 32
+
+@lru_cache(maxsize=None)
+def get_jinja_env() -> 'Environment':
+    from jinja2 import Environment
+    return Environment(
+        variable_start_string="${{",
+        variable_end_string="}}",
+    )
 
-JINJA_ENV = Environment(
-    variable_start_string="${{",
-    variable_end_string="}}",
-)
+def __getattr__(name):
+    if name == "JINJA_ENV":
+        return get_jinja_env()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 APP_ALIASES = {
     "FastAPI": 'fastapi.FastAPI',
@@ -41,6 +60,7 @@ class ServerConfig(BaseModel):
     use_path: Optional[bool] = None
 
     def create(self, app_instance=None, app_path=None):
+        from .servers import create_server
         type = self.type
         if type in SERVER_ALIASES:
             type = SERVER_ALIASES[type]
@@ -49,11 +69,21 @@ class ServerConfig(BaseModel):
             config["port"] = int(config['port'])
         return create_server(app_instance=app_instance, app_path=app_path, cls_name=type, config=config)
 
+    def get_class(self):
+        "Get the server class"
+        from .servers import get_server_class
+        type = SERVER_ALIASES.get(self.type, self.type)
+        try:
+            return get_server_class(type)
+        except KeyError:
+            return load_instance(type)
+
     @property
     def use_path_only(self):
         if self.use_path is not None:
             return self.use_path
         
+        from .servers import get_server_class
         type = self.type
         if type is not None:
             try:
@@ -73,15 +103,24 @@ class InstanceConfig(BaseModel):
 
     def create(self, **kwargs):
         "Create the instance"
+        return self.instantiate(self.load(), **kwargs)
+
+    def load(self):
+        "Import the instance or its class"
         if self.instance is not None:
             return load_instance(self.instance)
 
         type = self.type
         if type in APP_ALIASES:
             type = APP_ALIASES[type]
-        cls = load_instance(type)
+        return load_instance(type)
+
+    def instantiate(self, obj, **kwargs):
+        "Create the instance from the imported object"
+        if self.instance is not None:
+            return obj
         params = self.dict(exclude={"type", "instance", "lazy_load"})
-        return self.initiate(cls, **params, **kwargs)
+        return self.initiate(obj, **params, **kwargs)
 
     def get_path(self):
         return self.instance
@@ -94,20 +133,53 @@ class InstanceConfig(BaseModel):
 class AppConfig(BaseModel):
     app: InstanceConfig = Field(description="Type of the instance/app")
     server: Optional[ServerConfig] = Field(description="Server to run the instance")
+    process: Optional[bool] = Field(description="Whether to run the app in a child process")
+
+    def create(self, process:bool=False, measure=None, dry_run:bool=False):
+        """Create the server of the app
 
-    def create(self):
+        Phases (import, instantiate and server) are
+        measured with measure (context manager by
+        phase name) if given. In dry run, the app is
+        created in the current process and None is
+        returned instead of a server that would bind
+        a socket on creation."""
+        from .servers import DummyServer, ProcessServer
+        if measure is None:
+            measure = lambda phase: nullcontext()
+        if dry_run:
+            if self.server is not None and getattr(self.server.get_class(), "binds_on_create", True):
+                self._create_instance(measure)
+                return None
+        elif self.process if self.process is not None else process:
+            # Passed as validated to the child process
+            with measure("server"):
+                return ProcessServer(config=self.copy(update={"process": None}))
         if self.server is None:
-            instance = self.app.create()
-            server = DummyServer(app_instance=instance)
+            instance = self._create_instance(measure)
+            with measure("server"):
+                server = DummyServer(app_instance=instance)
         elif self.server.use_path_only:
-            server = self.server.create(app_path=self.app.get_path())
+            with measure("server"):
+                server = self.server.create(app_path=self.app.get_path())
         else:
-            instance = self.app.create()
-            server = self.server.create(app_instance=instance)
+            instance = self._create_instance(measure)
+            with measure("server"):
+                server = self.server.create(app_instance=instance)
         return server
 
+    def _create_instance(self, measure):
+        with measure("import"):
+            obj = self.app.load()
+        with measure("instantiate"):
+            return self.app.instantiate(obj)
+
 class Config(BaseModel):
     apps: Dict[str, AppConfig]
+    process: bool = Field(default=False, description="Whether to run the apps in child processes by default")
+    parallel: bool = Field(default=False, description="Whether to create the apps concurrently in threads (imports must be thread-safe)")
+    shutdown_timeout: Optional[float] = Field(default=60, description="Seconds to wait for the apps to shut down gracefully before forcing")
+    force_timeout: float = Field(default=5, description="Seconds to wait for the forced apps to exit before abandoning them")
 
     @classmethod
     def parse(cls, conf:dict):
@@ -116,26 +188,78 @@ class Config(BaseModel):
 
     @classmethod
     def parse_yaml(cls, __file, **kwargs):
-        c = parse_file(__file, **kwargs)
-        return cls.parse(c)
+        return cls.load_yaml(__file, **kwargs).create()
+
+    @classmethod
+    def load_yaml(cls, __file, **kwargs) -> 'Config':
+        """Read and validate a config file
+
+        The rendered config is cached on disk (as JSON)
+        thus reading the same file with the same template
+        variables again (ie. on restarts) skips rendering
+        the template and parsing the YAML. The config is
+        still validated on every load."""
+        content = Path(__file).read_bytes()
+        key = _get_cache_key(content, kwargs)
+        data = _read_cache(key)
+        if data is not None:
+            try:
+                return cls.parse_obj(data)
+            except ValidationError:
+                # Valid only for an older version of the models
+                pass
+        data = parse_file(__file, **kwargs)
+        config = cls.parse_obj(data)
+        _write_cache(key, data)
+        return config
 
     @classmethod
     def parse_template(cls, __tmpl, **kwargs):
         return cls.parse_yaml(ROOT_TEMPLATES / f"{__tmpl}.yaml", **kwargs)
 
-    def _create_apps(self):
-        return {
-            name: app_config.create()
-            for name, app_config in self.apps.items()
-        }
+    @classmethod
+    def load_template(cls, __tmpl, **kwargs) -> 'Config':
+        return cls.load_yaml(ROOT_TEMPLATES / f"{__tmpl}.yaml", **kwargs)
+
+    def _create_apps(self, timeline:Timeline, dry_run:bool=False):
+        def create(name, app_config):
+            return app_config.create(process=self.process, measure=partial(timeline.measure, app=name), dry_run=dry_run)
+        if not self.parallel or len(self.apps) < 2:
+            return {name: create(name, app_config) for name, app_config in self.apps.items()}
+
+        # Creating apps is mostly importing modules
+        # thus threads are enough
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.apps), thread_name_prefix="subsystems-create") as executor:
+            futures = {
+                name: executor.submit(create, name, app_config)
+                for name, app_config in self.apps.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
 
-    def create(self):
+    def create(self, timeline:Optional[Timeline]=None) -> 'Subsystems':
         "Turn config to actual subsystems"
-        return Subsystems(**self._create_apps())
+        from .systems import Subsystems
+        if timeline is None:
+            timeline = Timeline()
+        systems = Subsystems(**self._create_apps(timeline))
+        systems.shutdown_timeout = self.shutdown_timeout
+        systems.force_timeout = self.force_timeout
+        systems.timeline = timeline
+        return systems
+
+    def check(self, timeline:Optional[Timeline]=None) -> Timeline:
+        """Create the apps without binding sockets
+        (dry run) to validate the config"""
+        if timeline is None:
+            timeline = Timeline()
+        self._create_apps(timeline, dry_run=True)
+        return timeline
 
 def parse_file(__path, **kwargs):
+    import yaml
     content = Path(__path).read_text()
-    tmpl = JINJA_ENV.from_string(content)
+    tmpl = get_jinja_env().from_string(content)
 
     kwargs.update(
         __dir_subsystems__=str(ROOT)
@@ -144,5 +268,70 @@ def parse_file(__path, **kwargs):
     yaml_content = tmpl.render(**kwargs)
     return yaml.safe_load(yaml_content)
 
+def get_cache_dir() -> Optional[Path]:
+    """Get the directory of cached configs or None if
+    caching is disabled (SUBSYSTEMS_CACHE_DIR is empty)"""
+    path = os.environ.get("SUBSYSTEMS_CACHE_DIR")
+    if path is None:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache_home) / "subsystems"
+    return Path(path) if path else None
+
+def _get_cache_key(content:bytes, kwargs:dict) -> str:
+    # Anything that may change the outcome
+    hasher = hashlib.sha256(content)
+    meta = {
+        "kwargs": kwargs,
+        "root": str(ROOT),
+        "version": __version__,
+        "pydantic": str(PYDANTIC_VERSION),
+        "python": list(sys.version_info[:2]),
+    }
+    hasher.update(json.dumps(meta, sort_keys=True, default=str).encode())
+    return hasher.hexdigest()
+
+def _read_cache(key:str) -> Optional[dict]:
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    path = cache_dir / f"config-{key}.json"
+    try:
+        with open(path, "rb") as file:
+            data = json.load(file)
+        # Recently used entries are evicted last
+        os.utime(path)
+    except Exception:
+        # Missing or corrupted
+        return None
+    return data if isinstance(data, dict) else None
+
+def _write_cache(key:str, data:dict):
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return
+    try:
+        content = json.dumps(data)
+        if json.loads(content) != data:
+            # Not plain JSON (ie. dates from YAML)
+            return
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # Written atomically as other processes may read it
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+        os.replace(tmp, cache_dir / f"config-{key}.json")
+        _evict_cache(cache_dir)
+    except Exception:
+        # Caching is only an optimization
+        pass
+
+def _evict_cache(cache_dir:Path):
+    # Pickles are from older versions
+    for path in cache_dir.glob("config-*.pickle"):
+        path.unlink()
+    paths = sorted(cache_dir.glob("config-*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in paths[MAX_CACHE_ENTRIES:]:
+        path.unlink()
+
 def get_template(tmpl) -> str:
     return (ROOT_TEMPLATES / f"{tmpl}.yaml").read_text()
\ No newline at end of file
@@ -2,14 +2,13 @@
 
 from pathlib import Path
 
-from subsystems.config import Config, get_template
-
 
 ROOT = Path(__file__).parent
 
 DEFAULT_CONF = "subsystems.yaml"
 
 def init_subsystems(tmpl):
+    from subsystems.config import get_template
     filename = DEFAULT_CONF
     content = get_template(tmpl)
     file = Path(filename)
@@ -18,25 +17,47 @@ def init_subsystems(tmpl):
     file.write_text(content)
 
 
+def report_timeline(timeline, profile:str):
+    "Write the timeline to a file (Chrome trace if JSON) or to stdout"
+    if profile == "-":
+        print(timeline.to_text())
+    elif profile.endswith(".json"):
+        Path(profile).write_text(timeline.to_chrome_trace())
+    else:
+        Path(profile).write_text(timeline.to_text())
+
+def launch(app=None, template=None, config=None, dry_run=False, profile=None, **kwargs):
+    from subsystems.config import Config
+    from subsystems.utils.timing import Timeline
+    timeline = Timeline()
+    with timeline.measure("config"):
+        if template:
+            conf = Config.load_template(template, scheduler=kwargs.pop("scheduler"))
+        else:
+            conf = Config.load_yaml(config if config is not None else DEFAULT_CONF, **kwargs)
+    if app:
+        conf = conf.copy(update={"apps": {name: conf.apps[name] for name in app}})
+
+    if dry_run:
+        conf.check(timeline)
+        if profile is not None:
+            report_timeline(timeline, profile)
+        return
+
+    subsystems = conf.create(timeline)
+    if profile is not None:
+        subsystems.on_started.append(lambda: report_timeline(timeline, profile))
+    if app and len(app) == 1 and profile is None:
+        subsystems[app[0]].run()
+    else:
+        subsystems.run()
+
 def main(
     command:str,
     **kwargs
 ):
     if command == "launch":
-        tmpl = kwargs.pop("template", None)
-        if tmpl:
-            subsystems = Config.parse_template(tmpl, scheduler=kwargs.pop("scheduler"))
-        else:
-            config = kwargs.pop("config")
-            if config is None:
-                config = DEFAULT_CONF
-            subsystems = Config.parse_yaml(config, **kwargs)
-        app = kwargs.pop("app", None)
-        if app is None:
-            subsystems.run()
-        else:
-            app = app[0] if len(app) == 1 else app
-            subsystems[app].run()
+        launch(**kwargs)
     elif command == "init":
         tmpl = kwargs.pop("template", "rocketry")
-        init_subsystems(tmpl)
\ No newline at end of file
+        init_subsystems(tmpl)
@@ -1,5 +1,4 @@
 import argparse
-import json
 from .main import main as _main
 
 def parse_args(args=None):
@@ -22,6 +21,9 @@ def parse_args(args=None):
     launch.add_argument('app', type=str, nargs='*', help="Applications to start")
     launch.add_argument('--config', default=None, help="Subsystem file")
     launch.add_argument('--template', default=None, help="Premade subsystem to use")
+    launch.add_argument('--dry-run', dest='dry_run', action='store_true', help="Create the apps without serving them")
+    launch.add_argument('--profile', nargs='?', const='-', default=None, metavar="FILE",
+                        help="Report timings of the startup phases to stdout or to a file (Chrome trace if .json)")
 
     # Run both
     full = subparsers.add_parser('project', help='Launch front, back and the scheduler')
@@ -1,13 +1,24 @@
 import asyncio
+import logging
+import multiprocessing
+import os
 import signal
+import sys
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import TYPE_CHECKING, Dict, List, Type, Union
 
 from subsystems.utils.modules import load_instance
 
 if TYPE_CHECKING:
     import uvicorn
+    from subsystems.config import AppConfig
     from waitress.server import MultiSocketServer
 
+logger = logging.getLogger(__name__)
+
 def create_server(cls_name:str, **kwargs) -> 'ServerBase':
     try:
         cls = get_server_class(cls_name)
@@ -31,6 +42,8 @@ class ServerBase:
 
     use_instance = False
     use_import_path = False
+    # Whether creating the server binds its socket
+    binds_on_create = False
 
     _cls_servers: Dict[str, 'ServerBase'] = {}
 
@@ -46,9 +59,27 @@ class ServerBase:
     def create(self):
         ...
 
+    def prepare(self):
+        "Prepare serving before the event loop is started"
+        ...
+
     async def serve(self, *args, **kwargs):
         server = self.instance
-        await server.serve(*args, **kwargs)
+        if asyncio.iscoroutinefunction(getattr(server, "serve", None)):
+            await server.serve(*args, **kwargs)
+        else:
+            await self.serve_in_thread(*args, **kwargs)
+
+    async def serve_in_thread(self, *args, **kwargs):
+        "Run blocking server in a dedicated thread"
+        loop = asyncio.get_running_loop()
+        thread_name = f"{type(self).__name__}-{id(self)}"
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name)
+        try:
+            await loop.run_in_executor(executor, partial(self.run, *args, **kwargs))
+        finally:
+            # Not waited as the thread cannot be stopped if cancelled
+            executor.shutdown(wait=False)
 
     def run(self, *args, **kwargs):
         server = self.instance
@@ -57,9 +88,19 @@ class ServerBase:
         elif hasattr(server, "serve_forever"):
             server.serve_forever(*args, **kwargs)
         else:
-            asyncio.run(self.serve(*args, **kwargs))
+            asyncio.run(server.serve(*args, **kwargs))
+
+    @property
+    def started(self) -> bool:
+        "Whether the server is ready to serve"
+        return True
 
     def handle_exit(self, *args, **kwargs):
+        "Shut down gracefully"
+        ...
+
+    def force_exit(self):
+        "Shut down without waiting the ongoing work to finish"
         ...
 
 class DummyServer(ServerBase):
@@ -70,21 +111,244 @@ class DummyServer(ServerBase):
     def create(self):
         return self.app_instance
 
+class ProcessServer(ServerBase):
+    """Server that runs an app in a child process
+
+    The app is created from its config in the child
+    process and the process is restarted if it crashes.
+    """
+    use_instance = False
+    use_import_path = False
+
+    instance: multiprocessing.Process
+
+    max_restarts = 3
+    restart_delay = 1.0
+    # Restarts are counted again after running this long
+    healthy_after = 60.0
+
+    def __init__(self, *args, **kwargs):
+        self.should_exit = False
+        super().__init__(*args, **kwargs)
+
+    def create(self):
+        ctx = multiprocessing.get_context("spawn")
+        return ctx.Process(target=_run_app, args=(self.config,), daemon=False)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        restarts = 0
+        while True:
+            if self.instance.exitcode is not None:
+                # Processes cannot be restarted
+                self.instance = self.create()
+            started = time.monotonic()
+            self.instance.start()
+            await loop.run_in_executor(None, self.instance.join)
+            if time.monotonic() - started >= self.healthy_after:
+                # Crashed after running fine, not a crash loop
+                restarts = 0
+            if self.should_exit or self.instance.exitcode == 0 or restarts >= self.max_restarts:
+                break
+            restarts += 1
+            await asyncio.sleep(self.restart_delay)
+            if self.should_exit:
+                # Asked to exit while waiting
+                break
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    @property
+    def started(self) -> bool:
+        return self.instance.is_alive()
+
+    def handle_exit(self, sig=None, frame=None):
+        self.should_exit = True
+        process = self.instance
+        if not process.is_alive():
+            return
+        if sys.platform == "win32" or sig is None:
+            process.terminate()
+        else:
+            os.kill(process.pid, sig)
+
+    def force_exit(self):
+        self.should_exit = True
+        if self.instance.is_alive():
+            self.instance.kill()
+
+def _run_app(config:Union[dict, 'AppConfig']):
+    # Entry point of the child process of ProcessServer
+    from subsystems.config import AppConfig
+    if hasattr(os, "setpgrp"):
+        # Signals from the terminal are forwarded by the parent
+        os.setpgrp()
+    if isinstance(config, dict):
+        config = AppConfig(**config)
+    config.create().run()
+
 # FastAPI Servers
 # ---------------
 
 class UvicornServer(ServerBase):
+    """Uvicorn server
+
+    If workers is more than one, the listening socket is
+    bound in the current process and the workers are
+    forked (in prepare) to serve it. The workers are
+    restarted with a backoff if they die.
+
+    An AutoAPI cannot have multiple workers as each would
+    run the scheduler. Use ProxyAPI workers connecting to
+    the control_socket of one AutoAPI instead.
+    """
     use_instance = True
     use_import_path = True
 
     instance: 'uvicorn.Server'
 
+    check_interval = 0.5
+    max_restarts = 5
+    # Doubled for each consecutive crash of a worker
+    restart_delay = 0.5
+    # Restarts are counted again after running this long
+    healthy_after = 60.0
+
+    def __init__(self, *args, **kwargs):
+        self.should_exit = False
+        self.processes: List[multiprocessing.Process] = []
+        self._sock = None
+        super().__init__(*args, **kwargs)
+        if self.instance.config.workers > 1 and _is_auto_api(self.app_instance):
+            raise ValueError(
+                "AutoAPI cannot have multiple workers as each would run the scheduler. "
+                "Use ProxyAPI workers with the control_socket of AutoAPI instead."
+            )
+
     def create(self):
         import uvicorn 
         return uvicorn.Server(uvicorn.Config(app=self.app_instance, **self.config))
 
-    def handle_exit(self, *args, **kwargs):
-        self.instance.handle_exit(*args, **kwargs)
+    @property
+    def workers(self) -> int:
+        workers = self.instance.config.workers
+        if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            # Workers need to inherit the app instance
+            warnings.warn("Multiple workers require fork, using one worker")
+            return 1
+        return workers
+
+    async def serve(self, *args, **kwargs):
+        if self.workers > 1:
+            await self.serve_workers()
+        else:
+            await self.instance.serve(*args, **kwargs)
+
+    def run(self, *args, **kwargs):
+        if self.workers > 1:
+            self.prepare()
+            asyncio.run(self.serve_workers())
+        else:
+            self.instance.run(*args, **kwargs)
+
+    def prepare(self):
+        "Fork the workers (so they don't inherit a running loop)"
+        if self.workers > 1 and not self.processes:
+            self._start_workers()
+
+    async def serve_workers(self):
+        "Serve the app with forked worker processes"
+        if not self.processes:
+            # Not prepared, forking from the running loop
+            self._start_workers()
+        loop = asyncio.get_running_loop()
+        n_workers = len(self.processes)
+        started = [time.monotonic()] * n_workers
+        restarts = [0] * n_workers
+        restart_at = [None] * n_workers
+        failed = set()
+        try:
+            while not self.should_exit:
+                now = time.monotonic()
+                for i, process in enumerate(self.processes):
+                    if i in failed or process.is_alive():
+                        continue
+                    if restart_at[i] is None:
+                        process.join()
+                        if now - started[i] >= self.healthy_after:
+                            # Died after running fine, not a crash loop
+                            restarts[i] = 0
+                        if restarts[i] >= self.max_restarts:
+                            logger.error(f"Uvicorn worker {i} crashed {restarts[i] + 1} times in a row, not restarting")
+                            failed.add(i)
+                            continue
+                        restart_at[i] = now + self.restart_delay * 2 ** restarts[i]
+                        restarts[i] += 1
+                    elif now >= restart_at[i]:
+                        self.processes[i] = self._start_worker()
+                        started[i] = now
+                        restart_at[i] = None
+                if len(failed) == n_workers:
+                    raise RuntimeError("All workers crashed")
+                await asyncio.sleep(self.check_interval)
+            for process in self.processes:
+                await loop.run_in_executor(None, process.join)
+        finally:
+            self._sock.close()
+
+    @property
+    def started(self) -> bool:
+        if self.processes:
+            # The socket is bound before forking
+            return True
+        return self.instance.started
+
+    def _start_workers(self):
+        # The socket is shared by the workers
+        self._sock = self.instance.config.bind_socket()
+        self.processes = [self._start_worker() for _ in range(self.workers)]
+
+    def _start_worker(self) -> multiprocessing.Process:
+        ctx = multiprocessing.get_context("fork")
+        process = ctx.Process(target=_run_worker, args=(self.instance, self._sock), daemon=False)
+        process.start()
+        return process
+
+    def handle_exit(self, sig=None, frame=None):
+        if not self.processes:
+            if hasattr(self.app_instance, "close_streams"):
+                # Uvicorn waits the responses to finish before the shutdown events
+                self.app_instance.close_streams()
+            self.instance.handle_exit(sig, frame)
+            return
+        self.should_exit = True
+        for process in self.processes:
+            if process.is_alive():
+                os.kill(process.pid, sig or signal.SIGTERM)
+
+    def force_exit(self):
+        if not self.processes:
+            self.instance.force_exit = True
+            return
+        self.should_exit = True
+        for process in self.processes:
+            if process.is_alive():
+                process.kill()
+
+def _is_auto_api(app) -> bool:
+    # AutoAPI is only imported if used
+    apps = sys.modules.get("subsystems.apps")
+    return apps is not None and isinstance(app, apps.AutoAPI)
+
+def _run_worker(server:'uvicorn.Server', sock):
+    # Entry point of a worker process of UvicornServer
+    # The signal handlers of the parent's loop are inherited
+    signal.set_wakeup_fd(-1)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    os.setpgrp()
+    server.run(sockets=[sock])
 
 class HypercornServer(ServerBase):
     use_instance = False
@@ -106,23 +370,32 @@ class WaitressServer(ServerBase):
 
     instance: 'MultiSocketServer'
 
+    binds_on_create = True
+
     def create(self):
         import waitress
         return waitress.create_server(application=self.app_instance, **self.config)
 
     def handle_exit(self, *args, **kwargs):
-        self.instance.close(*args, **kwargs)
+        from waitress import wasyncore
+        server = self.instance
+        server.close()
+        # Open connections would keep the server running
+        socket_map = getattr(server, "map", None) or getattr(server, "_map", None)
+        if socket_map:
+            wasyncore.close_all(socket_map)
 
 class WerkzeugServer(ServerBase):
     use_instance = True
     use_import_path = True
+    binds_on_create = True
 
     def create(self):
         import werkzeug
         return werkzeug.serving.make_server(app=self.app_instance, **self.config)
 
     def handle_exit(self, *args, **kwargs):
-        self.instance.shutdown(*args, **kwargs)
+        self.instance.shutdown()
 
 # Hybrid Servers
 # --------------
@@ -1,10 +1,14 @@
 import asyncio
+import logging
 import threading
 import signal
-from typing import Dict
+from typing import Callable, Dict, List, Optional
 
 from .servers import ServerBase
 from subsystems.utils.modules import load_instance
+from subsystems.utils.timing import Timeline
+
+logger = logging.getLogger(__name__)
 
 HANDLED_SIGNALS = (
     signal.SIGINT,  # Unix signal 2. Sent by Ctrl+C.
@@ -12,27 +16,81 @@ HANDLED_SIGNALS = (
 )
 
 class Subsystems:
+    """Collection of servers served together
+
+    On exit, the servers are asked to shut down gracefully
+    (stop accepting and finish the in-flight requests). The
+    servers still running after shutdown_timeout seconds
+    are forced to exit and, if they still do not stop in
+    force_timeout seconds, they are abandoned. What happened
+    to each server is stored to shutdown_report, including
+    the tasks the apps (ie. AutoAPI) had to terminate.
+    """
+
+    shutdown_timeout: Optional[float] = 60.0
+    force_timeout: float = 5.0
 
     def __init__(self, **systems:Dict[str, ServerBase]):
         self.systems = systems
-
-    def handle_exit(self, *args, **kwargs):
-        for system in self.systems:
-            system.handle_exit()
+        self.shutdown_report: Dict[str, str] = {}
+        # Timings of creating the apps (if created from config)
+        self.timeline: Optional[Timeline] = None
+        # Called when all the servers have started
+        self.on_started: List[Callable[[], None]] = []
+        self._loop = None
+        self._exiting = None
 
     async def serve(self):
-        tasks = []
+        self._loop = asyncio.get_running_loop()
+        self._exiting = asyncio.Event()
+        self.shutdown_report = {}
         self.install_signal_handlers()
         import uvicorn
         uvicorn.Server.install_signal_handlers = lambda *args, **kwargs: None
 
-        for name, system in self.systems.items():
-            #system._disable_signals()
-            task = asyncio.create_task(system.serve())
-            tasks.append(task)
-        await asyncio.wait(tasks)
+        tasks = {
+            asyncio.create_task(system.serve()): name
+            for name, system in self.systems.items()
+        }
+        starting = asyncio.create_task(self._wait_started())
+        exiting = asyncio.create_task(self._exiting.wait())
+        pending = set(tasks)
+        while pending and not exiting.done():
+            _, pending = await asyncio.wait(pending | {exiting}, return_when=asyncio.FIRST_COMPLETED)
+            pending.discard(exiting)
+        exiting.cancel()
+        starting.cancel()
+
+        if pending:
+            # Draining
+            _, pending = await asyncio.wait(pending, timeout=self.shutdown_timeout)
+        if pending:
+            for task in pending:
+                name = tasks[task]
+                logger.warning(f"App {name!r} did not shut down in {self.shutdown_timeout} seconds, forcing exit")
+                self._report(name, "forced")
+                self._call_exit(name, self.systems[name].force_exit)
+            _, pending = await asyncio.wait(pending, timeout=self.force_timeout)
+        for task in pending:
+            name = tasks[task]
+            logger.warning(f"App {name!r} did not exit, abandoning it")
+            self._report(name, "abandoned")
+            task.cancel()
+        for task, name in tasks.items():
+            if name in self.shutdown_report:
+                pass
+            elif task.done() and not task.cancelled() and task.exception() is not None:
+                self._report(name, f"crashed: {task.exception()!r}")
+            else:
+                self._report(name, "stopped")
+            # Work that was cut off (only known of apps in this process)
+            terminated = getattr(self.systems[name].app_instance, "terminated_tasks", None)
+            if terminated:
+                self.shutdown_report[name] += f", terminated tasks: {', '.join(terminated)}"
 
     def run(self):
+        for system in self.systems.values():
+            system.prepare()
         asyncio.run(self.serve())
 
     def __getitem__(self, name) -> ServerBase:
@@ -40,7 +98,23 @@ class Subsystems:
         if isinstance(name, str):
             return self.systems[name]
         else:
-            return Subsystems(**{name: s for name, s in self.systems.items() if name in name})
+            names = name
+            systems = Subsystems(**{name: s for name, s in self.systems.items() if name in names})
+            systems.shutdown_timeout = self.shutdown_timeout
+            systems.force_timeout = self.force_timeout
+            systems.timeline = self.timeline
+            systems.on_started = self.on_started
+            return systems
+
+    async def _wait_started(self, interval:float=0.01):
+        timeline = self.timeline if self.timeline is not None else Timeline()
+        async def wait(name, system):
+            with timeline.measure("start", app=name):
+                while not system.started:
+                    await asyncio.sleep(interval)
+        await asyncio.gather(*(wait(name, system) for name, system in self.systems.items()))
+        for func in self.on_started:
+            func()
 
     def install_signal_handlers(self) -> None:
         if threading.current_thread() is not threading.main_thread():
@@ -58,8 +132,23 @@ class Subsystems:
                 signal.signal(sig, self.handle_exit)
 
     def handle_exit(self, *args, **kwargs):
-        for sys in self.systems.values():
-            sys.handle_exit(*args, **kwargs)
+        for name, system in self.systems.items():
+            self._call_exit(name, system.handle_exit, *args, **kwargs)
+        if self._loop is not None and not self._loop.is_closed():
+            # May be called from another thread
+            self._loop.call_soon_threadsafe(self._exiting.set)
+
+    def _call_exit(self, name:str, func, *args, **kwargs):
+        # A server failing to exit should not prevent
+        # shutting down the others
+        try:
+            func(*args, **kwargs)
+        except Exception as exc:
+            logger.warning(f"App {name!r} failed to exit: {exc!r}")
+            self._report(name, f"failed to exit: {exc!r}")
+
+    def _report(self, name:str, outcome:str):
+        self.shutdown_report[name] = outcome
     
     @classmethod
     def from_config(self, d:dict):
@@ -11,4 +11,10 @@ def tmpsyspath(tmpdir):
 
 @pytest.fixture()
 def port():
-    return random.randint(10000, 65534)
\ No newline at end of file
+    return random.randint(10000, 65534)
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    path = tmpdir.mkdir("_cache")
+    monkeypatch.setenv("SUBSYSTEMS_CACHE_DIR", str(path))
+    return path
@@ -1,8 +1,26 @@
+import asyncio
+import functools
+import json
+import logging
+import pstats
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
 import pytest
-from rocketry.conds import scheduler_cycles
+from rocketry.conds import scheduler_cycles, true
 from rocketry import Rocketry
+from rocketry.log import MinimalRecord
+from redbird.repos import MemoryRepo
 
-from subsystems.apps import AutoAPI
+from subsystems.apps import AutoAPI, ProxyAPI
+from subsystems.api import control, encoding, logs, router, stats
+from subsystems.api.control import ControlClient, ControlServer
+from subsystems.api.router import RocketryRoutes, create_rocketry_routes
+from subsystems.api.snapshots import HEARTBEAT, HEARTBEAT_OFFSET, SnapshotPublisher, SnapshotReader
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 
 def do_success():
@@ -81,4 +99,671 @@ def test_get_logs(scheduler, client):
 
     body = response.json()
     assert isinstance(body, list)
-    assert len(body) > 3
\ No newline at end of file
+    assert len(body) > 3
+
+@pytest.fixture()
+def log_client():
+    repo = MemoryRepo(model=MinimalRecord)
+    for i in range(10):
+        repo.add(MinimalRecord(task_name="do_short" if i % 2 else "do_stuff", action="run", created=1_000_000 + i))
+    app = Rocketry(logger_repo=repo)
+    return TestClient(AutoAPI(scheduler=app))
+
+def test_get_logs_limit(log_client):
+    response = log_client.get("/logs", params={"limit": 3})
+    assert response.status_code == 200
+    assert [log["task_name"] for log in response.json()] == ["do_short", "do_stuff", "do_short"]
+
+def test_get_logs_cursor(log_client):
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 4, "task": "do_short"}
+        if cursor is not None:
+            params["after"] = cursor
+        response = log_client.get("/logs", params=params)
+        assert response.status_code == 200
+        pages.append([log["created"] for log in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [4, 1]
+    created = sum(pages, [])
+    assert created == sorted(created, reverse=True)
+
+    # Back to newer records
+    response = log_client.get("/logs", params={"limit": 2, "before": response.headers["X-Prev-Cursor"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [log["task_name"] for log in body] == ["do_short", "do_stuff"]
+    assert body[0]["created"] == pages[0][-1]
+
+class LogRecord(MinimalRecord):
+    id: Optional[int]
+
+def create_tied_repo(repo_type, tmpdir):
+    if repo_type == "memory":
+        repo = MemoryRepo(model=MinimalRecord)
+    else:
+        pytest.importorskip("sqlalchemy")
+        import sqlalchemy.orm
+        from redbird.repos import SQLRepo
+        repo = SQLRepo(model=LogRecord, conn_string=f"sqlite:///{tmpdir / 'logs.db'}", table="task_log", if_missing="create", id_field="id")
+    for i in range(9):
+        # Three records share each timestamp
+        repo.add(LogRecord(id=i, task_name=f"task-{i}", action="run", created=1_000_000 + i // 3))
+    return repo
+
+@pytest.mark.parametrize("repo_type", ["memory", "sql"])
+def test_get_logs_cursor_ties(repo_type, tmpdir):
+    repo = create_tied_repo(repo_type, Path(str(tmpdir)))
+    client = TestClient(AutoAPI(scheduler=Rocketry(logger_repo=repo)))
+    names = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/logs", params=params)
+        assert response.status_code == 200
+        names += [log["task_name"] for log in response.json()]
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 2, "after": response.headers["X-Next-Cursor"]}
+    assert sorted(names) == sorted(f"task-{i}" for i in range(9))
+    assert len(names) == 9
+
+    # And back to the newest
+    newer = []
+    while True:
+        response = client.get("/logs", params={"limit": 2, "before": response.headers["X-Prev-Cursor"]})
+        assert response.status_code == 200
+        if not response.json():
+            break
+        newer[:0] = [log["task_name"] for log in response.json()]
+    assert newer == names[:-1]
+
+def test_get_logs_invalid_cursor(log_client):
+    response = log_client.get("/logs", params={"after": "not a cursor"})
+    assert response.status_code == 400
+
+@pytest.mark.parametrize("params", [
+    pytest.param({"limit": 2}, id="limit"),
+    pytest.param({"limit": 2, "task": "do_short"}, id="task"),
+    pytest.param({"limit": 2, "task": ["do_short", "do_stuff"], "action": "success"}, id="tasks"),
+    pytest.param({"limit": 50}, id="beyond buffer"),
+    pytest.param({"past": 1000}, id="past"),
+])
+def test_get_logs_buffer(scheduler, params):
+    api = AutoAPI(scheduler=scheduler, log_buffer={"size": 5, "task_size": 3})
+    scheduler.session.config.shut_cond = scheduler_cycles(2)
+    scheduler.session.config.instant_shutdown = True
+    for task in scheduler.session.tasks:
+        task.start_cond = true
+    scheduler.run()
+
+    buffer = api.log_buffer
+    assert len(buffer.records.rows) == 5
+    assert {name: len(ring.rows) for name, ring in buffer.task_records.items()} == {"do_short": 3, "do_stuff": 3, "do_things": 3}
+
+    client = TestClient(api)
+    response = client.get("/logs", params=params)
+    assert response.status_code == 200
+
+    expected = TestClient(AutoAPI(scheduler=scheduler)).get("/logs", params=params)
+    assert response.json() == expected.json()
+    assert response.headers.get("X-Next-Cursor") == expected.headers.get("X-Next-Cursor")
+
+    api.log_buffer.detach()
+
+def test_get_logs_buffer_evicted(scheduler):
+    # The rings of the tasks have evicted up to different points
+    api = AutoAPI(scheduler=scheduler, log_buffer={"task_size": 2})
+    for task_name, n in [("do_stuff", 3), ("do_short", 4)]:
+        for _ in range(n):
+            scheduler.session[task_name].log_running()
+            scheduler.session[task_name].log_success()
+
+    params = {"task": ["do_stuff", "do_short"], "limit": 3}
+    response = TestClient(api).get("/logs", params=params)
+    expected = TestClient(AutoAPI(scheduler=scheduler)).get("/logs", params=params)
+    assert response.json() == expected.json()
+    assert [log["task_name"] for log in response.json()] == ["do_short"] * 3
+
+    api.log_buffer.detach()
+
+def test_events(scheduler):
+    routes = RocketryRoutes(scheduler)
+
+    async def read_events():
+        events = routes.events.subscribe(tasks=["do_short"])
+        first = asyncio.ensure_future(events.__anext__())
+        await asyncio.sleep(0)
+
+        scheduler.session["do_stuff"].log_running()
+        scheduler.session["do_short"].log_running()
+        await routes.disable_task("do_short")
+
+        messages = [await first, await events.__anext__(), await events.__anext__()]
+        await events.aclose()
+        return messages
+
+    messages = asyncio.run(read_events())
+    assert [msg.split("\n")[0] for msg in messages] == ["event: log", "event: task", "event: task"]
+    log = json.loads(messages[0].split("data: ")[1])
+    assert log["task_name"] == "do_short"
+    assert log["action"] == "run"
+    task = json.loads(messages[2].split("data: ")[1])
+    assert task["name"] == "do_short"
+    assert task["disabled"]
+
+    # Not listening without subscribers
+    assert routes.events not in logging.getLogger("rocketry.task").handlers
+
+@pytest.mark.parametrize("path", ["/tasks", "/tasks/do_short"])
+def test_get_tasks_etag(client, scheduler, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Action changes the state
+    client.post("/tasks/do_short/disable")
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    # Logging changes the state
+    scheduler.session["do_short"].log_running()
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    # So does a change of the status after logging
+    scheduler.session["do_short"].status = "success"
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    etag = response.headers["ETag"]
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+def test_routes_shutdown(scheduler):
+    logger = logging.getLogger(scheduler.session.config.task_logger_basename)
+    handlers = list(logger.handlers)
+    app = FastAPI()
+    app.include_router(create_rocketry_routes(scheduler))
+    with TestClient(app) as client:
+        etag = client.get("/tasks").headers["ETag"]
+        assert len(logger.handlers) == len(handlers) + 1
+    assert logger.handlers == handlers
+
+    # Restarted
+    scheduler.session["do_short"].priority = 5
+    scheduler.session["do_short"].priority = 0
+    with TestClient(app) as client:
+        assert len(logger.handlers) == len(handlers) + 1
+        # Changes while stopped are not known
+        assert client.get("/tasks", headers={"If-None-Match": etag}).status_code == 200
+    assert logger.handlers == handlers
+
+    # Versions of other instances do not match
+    app = FastAPI()
+    app.include_router(create_rocketry_routes(scheduler))
+    with TestClient(app) as client:
+        assert client.get("/tasks", headers={"If-None-Match": etag}).status_code == 200
+
+def test_restart(scheduler):
+    logger = logging.getLogger(scheduler.session.config.task_logger_basename)
+    orig_handlers = list(logger.handlers)
+    api = AutoAPI(scheduler=scheduler, log_buffer=True, log_stats={"backfill": False}, metrics=True)
+    task = scheduler.session["do_short"]
+    with TestClient(api):
+        handlers = list(logger.handlers)
+        task.log_running()
+    assert logger.handlers == orig_handlers
+
+    # Logged while stopped
+    task.log_success()
+    with TestClient(api) as client:
+        assert sorted(logger.handlers, key=id) == sorted(handlers, key=id)
+        task.log_running()
+        assert [row[1].action for row in api.log_buffer.records.rows] == ["run"]
+        assert [(stat["action"], stat["count"]) for stat in client.get("/logs/stats").json()] == [("run", 1)]
+
+def test_get_tasks_snapshot(scheduler):
+    routes = RocketryRoutes(scheduler)
+    task = scheduler.session["do_short"]
+
+    snapshot = routes.snapshots.get(task)
+    assert routes.snapshots.get(task) is snapshot
+
+    # Changes outside the API
+    task.priority = 10
+    assert routes.snapshots.get(task).priority == 10
+
+    task.log_running()
+    updated = routes.snapshots.get(task)
+    assert updated is not snapshot
+    assert updated.status == "run"
+    assert updated.is_running
+    assert updated.start_cond == snapshot.start_cond
+
+    # Batch replaced in place
+    task.run(myparam="a")
+    updated = routes.snapshots.get(task)
+    task.batches[0] = type(task.batches[0])(myparam="b")
+    assert routes.snapshots.get(task) is not updated
+
+    assert len(routes.snapshots.get_all(scheduler.session.tasks)) == 3
+
+@pytest.mark.parametrize("encoding,compressed", [("gzip", True), ("identity", False), ("gzip;q=0, identity", False), ("*", True)])
+def test_export_logs_ndjson(log_client, encoding, compressed):
+    response = log_client.get("/logs/export", params={"task": "do_short"}, headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers.get("content-encoding") == ("gzip" if compressed else None)
+    assert response.headers["vary"] == "Accept-Encoding"
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["created"] for record in records] == [1000009, 1000007, 1000005, 1000003, 1000001]
+    assert {record["task_name"] for record in records} == {"do_short"}
+
+@pytest.mark.parametrize("repo_type", ["memory", "sql"])
+def test_export_logs_ties(repo_type, tmpdir, monkeypatch):
+    # Chunks end between records of the same timestamp
+    monkeypatch.setattr(router, "iter_logs", functools.partial(logs.iter_logs, chunk_size=2))
+    repo = create_tied_repo(repo_type, Path(str(tmpdir)))
+    client = TestClient(AutoAPI(scheduler=Rocketry(logger_repo=repo)))
+    response = client.get("/logs/export")
+    assert response.status_code == 200
+
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(record["task_name"] for record in records) == [f"task-{i}" for i in range(9)]
+
+def test_export_logs_csv(log_client):
+    response = log_client.get("/logs/export", params={"format": "csv", "max_created": 1000002})
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        "task_name,action,created",
+        "do_stuff,run,1000002.0",
+        "do_short,run,1000001.0",
+        "do_stuff,run,1000000.0",
+    ]
+
+def test_post_tasks_bulk(client, scheduler):
+    etag = client.get("/tasks").headers["ETag"]
+    response = client.post("/tasks/_bulk", json=[
+        {"action": "disable", "pattern": "do_s*"},
+        {"action": "patch", "tasks": ["do_things", "missing"], "values": {"priority": 5}},
+    ])
+    assert response.status_code == 200
+    assert response.json() == [
+        {"task": "do_short", "action": "disable", "success": True, "error": None},
+        {"task": "do_stuff", "action": "disable", "success": True, "error": None},
+        {"task": "do_things", "action": "patch", "success": True, "error": None},
+        {"task": "missing", "action": "patch", "success": False, "error": "Task 'missing' not found"},
+    ]
+    tasks = {task["name"]: task for task in client.get("/tasks").json()}
+    assert tasks["do_short"]["disabled"]
+    assert tasks["do_stuff"]["disabled"]
+    assert not tasks["do_things"]["disabled"]
+    assert tasks["do_things"]["priority"] == 5
+
+    # Single change of the state
+    nonce, version = etag.strip('W/"').split("-")
+    assert client.get("/tasks").headers["ETag"] == f'W/"{nonce}-{int(version) + 1}"'
+
+def test_get_log_stats(monkeypatch):
+    # Middle of a bucket
+    now = 1_000_000_050.0
+    monkeypatch.setattr(stats, "time", SimpleNamespace(time=lambda: now))
+    repo = MemoryRepo(model=MinimalRecord)
+    for i in reversed(range(10)):
+        repo.add(MinimalRecord(task_name="do_short", action="run" if i % 2 else "fail", created=now - 60 * i))
+    scheduler = Rocketry(logger_repo=repo)
+    scheduler.task(start_cond="every 10 seconds", func=do_success, name="do_short")
+    api = AutoAPI(scheduler=scheduler, log_stats={"bucket_size": 60, "retention": 5})
+    client = TestClient(api)
+    # Backfilled on the first request
+    assert api.log_stats.buckets == {}
+
+    # Backfilled within retention
+    response = client.get("/logs/stats")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"start": None, "task_name": "do_short", "action": "fail", "count": 3},
+        {"start": None, "task_name": "do_short", "action": "run", "count": 2},
+    ]
+
+    api.log_stats.handle(logging.makeLogRecord({"task_name": "do_short", "action": "run", "created": now}))
+    response = client.get("/logs/stats", params={"action": "run", "min_created": int(now - 60)})
+    assert response.json()[0]["count"] == 2
+
+    response = client.get("/logs/stats", params={"bucket": 60})
+    assert sum(stat["count"] for stat in response.json()) == 6
+    assert len({stat["start"] for stat in response.json()}) == 5
+
+    response = client.get("/logs/stats", params={"bucket": 90})
+    assert response.status_code == 400
+
+    api.log_stats.detach()
+
+    # Backfill is bounded
+    api = AutoAPI(scheduler=scheduler, log_stats={"bucket_size": 60, "retention": 5, "backfill_limit": 2})
+    response = TestClient(api).get("/logs/stats")
+    assert sum(stat["count"] for stat in response.json()) == 2
+    api.log_stats.detach()
+
+def test_get_log_stats_disabled(client):
+    response = client.get("/logs/stats")
+    assert response.status_code == 404
+
+def test_shutdown_terminates_tasks():
+    scheduler = Rocketry(execution="async")
+
+    @scheduler.task(true)
+    async def do_long():
+        await asyncio.sleep(60)
+
+    api = AutoAPI(scheduler=scheduler, shutdown_timeout=0.2)
+    with TestClient(api):
+        for _ in range(100):
+            if scheduler.session["do_long"].is_alive():
+                break
+            time.sleep(0.05)
+    assert api.terminated_tasks == ["do_long"]
+    assert scheduler.session["do_long"].status == "terminate"
+
+def test_shutdown_terminate_timeout():
+    scheduler = Rocketry(execution="thread")
+
+    @scheduler.task(true)
+    def do_stubborn():
+        # Ignores the termination
+        time.sleep(3)
+
+    api = AutoAPI(scheduler=scheduler, shutdown_timeout=0.1, terminate_timeout=0.1, scheduler_mode="thread")
+    with TestClient(api):
+        for _ in range(100):
+            if scheduler.session["do_stubborn"].is_alive():
+                break
+            time.sleep(0.05)
+        start = time.perf_counter()
+    # The scheduler is abandoned after the deadlines
+    assert time.perf_counter() - start < 2
+    assert api.terminated_tasks == ["do_stubborn"]
+
+def test_metrics(scheduler):
+    api = AutoAPI(scheduler=scheduler, metrics=True)
+    client = TestClient(api)
+    assert client.get("/tasks").status_code == 200
+    assert client.get("/tasks/do_short").status_code == 200
+    assert client.get("/logs").status_code == 200
+
+    logger = logging.getLogger(scheduler.session.config.task_logger_basename)
+    logger.info("Task finished", extra={"task_name": "do_short", "action": "success", "runtime": 0.2})
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    assert 'subsystems_http_request_duration_seconds_count{method="GET",route="/tasks",status="200"} 1' in text
+    # Route template, not the path
+    assert 'subsystems_http_request_duration_seconds_count{method="GET",route="/tasks/{task_name}",status="200"} 1' in text
+    assert 'subsystems_log_query_duration_seconds_count{endpoint="logs"} 1' in text
+    assert 'rocketry_task_actions_total{task="do_short",action="success"} 1' in text
+    assert 'rocketry_task_run_duration_seconds_bucket{task="do_short",action="success",le="0.5"} 1' in text
+    assert "rocketry_tasks_running 0" in text
+    api.metrics.detach()
+
+def test_metrics_disabled(client):
+    assert client.get("/metrics").status_code != 200
+
+@pytest.mark.parametrize("mode,format", [("sampling", "speedscope"), ("sampling", "collapsed"), ("cprofile", "text"), ("cprofile", "pstats")])
+def test_profiler(scheduler, tmpdir, mode, format):
+    api = AutoAPI(scheduler=scheduler, route_config={"profiler": {"token": "secret", "max_seconds": 1}})
+    client = TestClient(api)
+    params = {"seconds": 0.1, "mode": mode, "format": format}
+    headers = {"Authorization": "Bearer secret"}
+
+    assert client.post("/debug/profile", params=params).status_code == 403
+    assert client.post("/debug/profile", params=params, headers={"Authorization": "Bearer wrong"}).status_code == 403
+    assert client.post("/debug/profile", params={**params, "seconds": 5}, headers=headers).status_code == 400
+
+    resp = client.post("/debug/profile", params=params, headers=headers)
+    assert resp.status_code == 200
+    if format == "speedscope":
+        body = resp.json()
+        assert body["profiles"][0]["type"] == "sampled"
+        assert body["profiles"][0]["samples"]
+        assert all(0 <= i < len(body["shared"]["frames"]) for sample in body["profiles"][0]["samples"] for i in sample)
+    elif format == "collapsed":
+        # The event loop waits the sleep
+        assert "run_until_complete" in resp.text or "_run_once" in resp.text
+    elif format == "text":
+        assert "function calls" in resp.text
+    elif format == "pstats":
+        path = tmpdir.join("profile.pstats")
+        path.write_binary(resp.content)
+        assert pstats.Stats(str(path)).total_calls > 0
+
+def test_profiler_scheduler_thread(scheduler):
+    api = AutoAPI(scheduler=scheduler, scheduler_mode="thread", route_config={"profiler": {"token": "secret"}})
+    with TestClient(api) as client:
+        resp = client.post("/debug/profile", params={"seconds": 0.1, "format": "collapsed"}, headers={"Authorization": "Bearer secret"})
+    assert resp.status_code == 200
+    roots = {line.split(" (")[0] for line in resp.text.splitlines()}
+    assert f"thread {api.scheduler_thread.name}" in roots
+    assert len(roots) == 2
+
+def test_profiler_access(scheduler):
+    with pytest.raises(ValueError):
+        AutoAPI(scheduler=scheduler, route_config={"profiler": True})
+
+    # Test client is not a loopback client
+    api = AutoAPI(scheduler=scheduler, route_config={"profiler": {"allow_local": True}})
+    assert TestClient(api).post("/debug/profile", params={"seconds": 0.1}).status_code == 403
+
+def test_profiler_disabled(client):
+    assert client.post("/debug/profile").status_code in (404, 405)
+
+def test_scheduler_thread():
+    scheduler = Rocketry(execution="async")
+    threads = []
+
+    @scheduler.task(true)
+    async def do_stuff():
+        threads.append(threading.get_ident())
+        await asyncio.sleep(0.01)
+
+    api = AutoAPI(scheduler=scheduler, scheduler_mode="thread")
+    with TestClient(api) as client:
+        for _ in range(100):
+            if threads:
+                break
+            time.sleep(0.05)
+        assert api.scheduler_thread.is_alive()
+
+        assert client.post("/tasks/do_stuff/disable").status_code == 200
+        assert client.get("/tasks/do_stuff").json()["disabled"]
+        resp = client.post("/tasks/_bulk", json=[{"action": "enable", "tasks": ["do_stuff"]}])
+        assert resp.json() == [{"task": "do_stuff", "action": "enable", "success": True, "error": None}]
+        assert not scheduler.session["do_stuff"].disabled
+    assert not api.scheduler_thread.is_alive()
+    # Not run in the API's thread
+    assert threads[0] == api.scheduler_thread.thread.ident
+
+def test_scheduler_mode_invalid(scheduler):
+    with pytest.raises(ValueError):
+        AutoAPI(scheduler=scheduler, scheduler_mode="other")
+
+def test_proxy(scheduler, tmpdir):
+    socket = str(tmpdir / "control.sock")
+    api = AutoAPI(scheduler=scheduler, control_socket=socket)
+    with TestClient(api), TestClient(ProxyAPI(control_socket=socket, pool_size=2)) as client:
+        resp = client.get("/tasks")
+        assert resp.status_code == 200
+        assert {task["name"] for task in resp.json()} == {"do_short", "do_stuff", "do_things"}
+
+        # Actions are applied in the scheduler process
+        assert client.post("/tasks/do_short/disable").status_code == 200
+        assert scheduler.session["do_short"].disabled
+        assert client.get("/tasks/do_short").json()["disabled"]
+
+        assert client.get("/nonexistent").status_code == 404
+        assert client.get("/session/parameters").json() == {"myparam": "hello"}
+
+        # Connections are reused
+        assert len(client.app.control_client._idle) == 1
+
+        resp = client.get("/logs/export")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/x-ndjson"
+
+    assert not Path(socket).exists()
+
+def test_proxy_unreachable(tmpdir):
+    client = TestClient(ProxyAPI(control_socket=str(tmpdir / "control.sock")))
+    assert client.get("/tasks").status_code == 503
+
+def test_control_channel(tmpdir):
+    path = str(tmpdir / "control.sock")
+
+    async def app(scope, receive, send):
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": scope["path"].encode()})
+        # Listening for a disconnect must not consume the next request
+        try:
+            await asyncio.wait_for(receive(), 0.1)
+        except asyncio.TimeoutError:
+            pass
+
+    async def read_body(body):
+        return b"".join([chunk async for chunk in body])
+
+    async def run():
+        server = ControlServer(app, path)
+        await server.start()
+        client = ControlClient(path, pool_size=1)
+        try:
+            # Requests on the same connection
+            conns = []
+            for request_path in ("/a", "/b"):
+                status, _, body = await client.request("GET", request_path)
+                assert status == 200
+                assert await read_body(body) == request_path.encode()
+                conns.extend(client._idle)
+            assert len(conns) == 2
+            assert conns[0] is conns[1]
+
+            # Connections are limited to the pool size
+            _, _, body = await client.request("GET", "/a")
+            waiting = asyncio.ensure_future(client.request("GET", "/b"))
+            await asyncio.sleep(0.05)
+            assert not waiting.done()
+            await read_body(body)
+            _, _, body = await asyncio.wait_for(waiting, 1)
+            assert await read_body(body) == b"/b"
+
+            # Client disconnecting mid-frame
+            errors = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+            head = json.dumps({"method": "GET", "path": "/a", "query_string": "", "headers": []}).encode()
+            for frames in (control.FRAME.pack(control.HEAD, 100) + b"{", control.FRAME.pack(control.HEAD, len(head)) + head + control.FRAME.pack(control.BODY, 10) + b"x"):
+                _, writer = await asyncio.open_unix_connection(path)
+                writer.write(frames)
+                await writer.drain()
+                writer.close()
+            await asyncio.sleep(0.1)
+            assert errors == []
+        finally:
+            await client.close()
+            await server.close()
+    asyncio.run(run())
+
+def test_proxy_snapshot(scheduler, tmpdir):
+    socket = str(tmpdir / "control.sock")
+    snapshot = str(tmpdir / "tasks.snapshot")
+    api = AutoAPI(scheduler=scheduler, control_socket=socket, task_snapshot={"path": snapshot, "interval": 0.01})
+    proxy = ProxyAPI(control_socket=socket, task_snapshot=snapshot)
+    with TestClient(api) as owner_client, TestClient(proxy) as client:
+        for _ in range(100):
+            if Path(snapshot).exists():
+                break
+            time.sleep(0.01)
+        resp = client.get("/tasks")
+        assert resp.status_code == 200
+        assert resp.json() == owner_client.get("/tasks").json()
+        assert resp.headers["etag"].startswith('W/"')
+        assert client.get("/tasks", headers={"If-None-Match": resp.headers["etag"]}).status_code == 304
+
+        resp = client.get("/tasks/do_short")
+        assert resp.json() == owner_client.get("/tasks/do_short").json()
+        assert not resp.json()["disabled"]
+        assert client.get("/tasks/nonexistent", headers={"If-None-Match": resp.headers["etag"]}).status_code == 404
+
+        # Snapshot is not read from the control channel
+        reader = proxy.router.default.reader
+        assert reader.get().get_task("do_short").obj is reader.get().body.obj
+
+        assert client.post("/tasks/do_short/disable").status_code == 200
+        for _ in range(100):
+            if client.get("/tasks/do_short").json()["disabled"]:
+                break
+            time.sleep(0.01)
+        else:
+            pytest.fail("Snapshot was not updated")
+    assert not Path(snapshot).exists()
+
+def test_snapshot_heartbeat(scheduler, tmpdir):
+    path = str(tmpdir / "tasks.snapshot")
+    publisher = SnapshotPublisher(scheduler.session, path, interval=0.1)
+    reader = SnapshotReader(path, stale_intervals=5)
+    assert publisher.publish()
+    snapshot = reader.get()
+    assert snapshot is not None
+
+    # Publisher stopped beating
+    with open(path, "r+b") as file:
+        file.seek(HEARTBEAT_OFFSET)
+        file.write(HEARTBEAT.pack(time.time() - 1))
+    assert reader.get() is None
+
+    publisher.beat()
+    assert reader.get() is snapshot
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_fast_json(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(encoding, "orjson", None)
+    elif encoding.orjson is None:
+        pytest.skip("orjson not installed")
+
+    def create_client(**kwargs):
+        repo = MemoryRepo(model=MinimalRecord)
+        for i in range(10):
+            repo.add(MinimalRecord(task_name="do_short" if i % 2 else "do_stuff", action="run", created=1_000_000 + i + 0.25))
+        app = Rocketry(logger_repo=repo)
+        app.params(myparam="hello")
+        app.task(start_cond="every 10 seconds", func=do_success, name="do_short")
+        app.task(start_cond="every 10 seconds", func=do_success, name="do_stuff")
+        return TestClient(AutoAPI(scheduler=app, **kwargs))
+
+    client = create_client()
+    fast_client = create_client(fast_json=True)
+    for path in ("/tasks", "/tasks/do_short", "/logs?limit=3", "/session/parameters"):
+        resp = client.get(path)
+        fast_resp = fast_client.get(path)
+        assert fast_resp.status_code == 200
+        assert fast_resp.json() == resp.json()
+        assert fast_resp.headers["content-type"] == "application/json"
+    assert fast_client.get("/logs?limit=3").headers["X-Next-Cursor"] == client.get("/logs?limit=3").headers["X-Next-Cursor"]
+    assert fast_client.post("/task/do_short/logs").json() == client.post("/task/do_short/logs").json()
+
+    etag = fast_client.get("/tasks").headers["etag"]
+    assert fast_client.get("/tasks", headers={"If-None-Match": etag}).status_code == 304
@@ -2,6 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from pathlib import Path
 from subsystems.apps import StaticApp
+from subsystems.utils.assets import HASHED_FILE
 import subsystems
 
 APP_ROOT = Path(subsystems.__file__).parent / "app"
@@ -21,4 +22,95 @@ def test_static_app():
     # Should return index.html 
     resp = client.get("/custom-route")
     assert resp.status_code == 200
-    assert resp.content == cont_index
\ No newline at end of file
+    assert resp.content == cont_index
+
+def test_static_app_cached(tmpdir):
+    index = "<html><body>App</body></html>"
+    script = "console.log('hello');\n" * 200
+    tmpdir.join("index.html").write(index)
+    tmpdir.join("favicon.ico").write_binary(b"\x00\x01" * 10)
+    tmpdir.mkdir("static").mkdir("js").join("main.3f2a1b9c.js").write(script)
+
+    app = StaticApp(path=tmpdir / "index.html", static_path=tmpdir, custom_routes={"_config": {"x": 1}}, cache_assets=True)
+    client = TestClient(app)
+
+    resp = client.get("/static/js/main.3f2a1b9c.js", headers={"Accept-Encoding": "gzip"})
+    assert resp.status_code == 200
+    assert resp.text == script
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    resp = client.get("/static/js/main.3f2a1b9c.js", headers={"Accept-Encoding": "identity"})
+    assert resp.text == script
+    assert "content-encoding" not in resp.headers
+
+    resp = client.get("/static/js/main.3f2a1b9c.js", headers={"Accept-Encoding": "*"})
+    assert resp.headers["content-encoding"] == "gzip"
+    resp = client.get("/static/js/main.3f2a1b9c.js", headers={"Accept-Encoding": "*, gzip;q=0"})
+    assert "content-encoding" not in resp.headers
+
+    resp = client.get("/favicon.ico")
+    assert resp.content == b"\x00\x01" * 10
+    assert resp.headers["cache-control"] == "no-cache"
+    etag = resp.headers["etag"]
+
+    resp = client.get("/favicon.ico", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+
+    # Unknown paths and root are the app
+    for route in ("/", "/tasks/do_things"):
+        resp = client.get(route)
+        assert resp.status_code == 200
+        assert resp.text == index
+
+    resp = client.get("/_config")
+    assert resp.json() == {"x": 1}
+
+@pytest.mark.parametrize("name,immutable", [
+    ("main.3f2a1b9c.js", True),
+    ("main.3f2a1b9c.css", True),
+    ("787.c4e7f8f0.chunk.js", True),
+    ("main.3f2a1b9c.chunk.css", True),
+    ("main.3f2a1b9c.js.map", True),
+    ("logo.6ce24c58.svg", True),
+    ("main.js", False),
+    ("manifest.json", False),
+    ("robots.txt", False),
+    ("main.3f2a1b.js", False),
+])
+def test_hashed_file(name, immutable):
+    assert (HASHED_FILE.search(name) is not None) == immutable
+
+def test_static_app_cache_limits(tmpdir):
+    tmpdir.join("index.html").write("<html>App</html>")
+    tmpdir.join("large.bin").write_binary(b"x" * 2000)
+    tmpdir.join("small.txt").write("small")
+    app = StaticApp(path=tmpdir / "index.html", static_path=tmpdir, cache_assets={"max_file_size": 1000})
+    assert app.assets.skipped == {"large.bin"}
+    assert app.assets.get("small.txt") is not None
+
+    # Served from the disk
+    resp = TestClient(app).get("/large.bin")
+    assert resp.status_code == 200
+    assert resp.content == b"x" * 2000
+
+def test_static_app_custom_routes(tmpdir):
+    tmpdir.join("index.html").write("<html>App</html>")
+    app = StaticApp(path=tmpdir / "index.html", static_path=tmpdir, custom_routes={"_config": {"backend_url": "http://localhost:8080"}, "page": "<p>Page</p>"})
+    client = TestClient(app)
+
+    resp = client.get("/_config")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/json"
+    assert resp.content == b'{"backend_url":"http://localhost:8080"}'
+
+    resp = client.get("/_config", headers={"If-None-Match": resp.headers["etag"]})
+    assert resp.status_code == 304
+
+    resp = client.get("/page")
+    assert resp.headers["content-type"] == "text/html; charset=utf-8"
+    assert resp.text == "<p>Page</p>"
+
+    # Not cached, falls back to the app
+    resp = client.get("/tasks/do_things")
+    assert resp.text == "<html>App</html>"
@@ -1,5 +1,8 @@
 from pathlib import Path
 from textwrap import dedent
+import json
+import subprocess
+import sys
 import uuid
 import pytest
 from subsystems.main_cli import parse_args, main
@@ -16,33 +19,59 @@ import subsystems
             'app': [],
             'template': None,
             'config': 'myconf.yaml',
+            'dry_run': False,
+            'profile': None,
         }, id="launch (config)"),
         pytest.param(["launch", '--template', 'rocketry'], {
             'command': 'launch', 
             'app': [],
             'template': 'rocketry',
             'config': None,
+            'dry_run': False,
+            'profile': None,
         }, id="launch (template)"),
         pytest.param(["launch", 'frontend', '--template', 'rocketry'], {
             'command': 'launch', 
             'app': ['frontend'],
             'template': 'rocketry',
             'config': None,
+            'dry_run': False,
+            'profile': None,
         }, id="launch (specific app)"),
         pytest.param(["launch", 'frontend', 'backend', '--template', 'rocketry'], {
             'command': 'launch', 
             'app': ['frontend', 'backend'],
             'template': 'rocketry',
             'config': None,
+            'dry_run': False,
+            'profile': None,
         }, id="launch (specific apps)"),
         pytest.param(["launch", '--template', 'rocketry', '--host-back', '0.0.0.0', '--port-back', '8080'], {
             'command': 'launch', 
             'app': [],
             'template': 'rocketry',
             'config': None,
+            'dry_run': False,
+            'profile': None,
             'host_back': '0.0.0.0',
             'port_back': '8080',
         }, id="launch (arbitrary params)"),
+        pytest.param(["launch", '--template', 'rocketry', '--dry-run', '--profile'], {
+            'command': 'launch',
+            'app': [],
+            'template': 'rocketry',
+            'config': None,
+            'dry_run': True,
+            'profile': '-',
+        }, id="launch (dry run, profile)"),
+        pytest.param(["launch", '--template', 'rocketry', '--profile', 'trace.json'], {
+            'command': 'launch',
+            'app': [],
+            'template': 'rocketry',
+            'config': None,
+            'dry_run': False,
+            'profile': 'trace.json',
+        }, id="launch (profile to file)"),
     ]
 )
 def test_parser(args, output):
@@ -89,4 +118,48 @@ def test_launch(tmpdir, tmpsyspath, how, port):
         elif how == "init":
             main(["init", "rocketry"])
             main(["launch", "backend", "--scheduler", f"{mdl_name}:app", "--port_back", str(port)])
-        assert Path("status.txt").is_file()
\ No newline at end of file
+        assert Path("status.txt").is_file()
+
+@pytest.mark.parametrize("profile", ["-", "profile.txt", "profile.json"])
+def test_launch_dry_run(tmpdir, tmpsyspath, capsys, profile):
+    tmpsyspath.append(str(tmpdir))
+    mdl_name = uuid.uuid4().hex
+    sched_file = tmpdir.join(f"{mdl_name}.py")
+    sched_file.write(dedent("""
+        from rocketry import Rocketry
+        app = Rocketry()
+    """))
+    with tmpdir.as_cwd():
+        main(["launch", "backend", "--template", "rocketry", "--scheduler", f"{mdl_name}:app", "--dry-run", "--profile", profile])
+        if profile == "-":
+            output = capsys.readouterr().out
+        else:
+            output = Path(profile).read_text()
+    if profile.endswith(".json"):
+        events = json.loads(output)["traceEvents"]
+        phases = [(event["args"]["app"], event["name"]) for event in events]
+    else:
+        phases = [tuple(line.split()[:2]) for line in output.splitlines()[1:]]
+    assert sorted(phases, key=str) == sorted([
+        ("-" if profile != "profile.json" else None, "config"),
+        ("backend", "import"),
+        ("backend", "instantiate"),
+        ("backend", "server"),
+    ], key=str)
+
+def _import_module(module):
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+@pytest.mark.parametrize("module,not_imported", [
+    pytest.param("subsystems.main_cli", ["yaml", "jinja2", "pydantic", "fastapi", "rocketry", "uvicorn", "asyncio"], id="CLI"),
+    pytest.param("subsystems.config", ["yaml", "jinja2", "fastapi", "rocketry", "uvicorn", "asyncio"], id="config"),
+    pytest.param("subsystems.servers", ["fastapi", "rocketry", "uvicorn", "waitress", "werkzeug"], id="servers"),
+    pytest.param("subsystems.apps", ["rocketry", "redbird", "uvicorn"], id="apps"),
+])
+def test_lazy_imports(module, not_imported):
+    # Heavy frameworks should be imported only when an app
+    # or a server of the type is created. The import time
+    # is measured in benchmarks/bench_startup.py
+    imported = set(_import_module(module).stdout.split())
+    assert not imported & set(not_imported)
@@ -1,4 +1,7 @@
+import importlib
 import sys
+import threading
+import uuid
 from textwrap import dedent
 
 from rocketry import Rocketry
@@ -6,6 +9,7 @@ from fastapi import FastAPI
 from fastapi.testclient import TestClient
 import pytest
 import uvicorn
+from subsystems import config as config_module
 from subsystems.config import Config
 from subsystems.systems import Subsystems
 from subsystems.servers import ServerBase
@@ -185,4 +189,103 @@ def test_aliases(server, app, server_cls, app_cls, port):
             }
         )
     assert isinstance(systems['myapp'].instance, load_instance(server_cls))
-    assert isinstance(systems['myapp'].app_instance, load_instance(app_cls))
\ No newline at end of file
+    assert isinstance(systems['myapp'].app_instance, load_instance(app_cls))
+
+def test_cache(tmpdir, cache_dir, monkeypatch):
+    file = tmpdir.join("subsystems.yaml")
+    file.write(dedent("""
+    apps:
+      backend:
+        app:
+          type: fastapi.FastAPI
+          description: "${{ description }}"
+    """))
+
+    config = Config.load_yaml(str(file), description="My app")
+    assert config.apps["backend"].app.description == "My app"
+    assert len(cache_dir.listdir()) == 1
+
+    # Cached
+    def parse_file(*args, **kwargs):
+        raise AssertionError("Config was not cached")
+    with monkeypatch.context() as m:
+        m.setattr(config_module, "parse_file", parse_file)
+        cached = Config.load_yaml(str(file), description="My app")
+    assert cached == config
+
+    # Changes in the template variables or in the file are not cached
+    config = Config.load_yaml(str(file), description="Other app")
+    assert config.apps["backend"].app.description == "Other app"
+
+    file.write(file.read().replace("fastapi.FastAPI", "flask.Flask"))
+    config = Config.load_yaml(str(file), description="My app")
+    assert config.apps["backend"].app.type == "flask.Flask"
+    assert len(cache_dir.listdir()) == 3
+
+    # Corrupted cache is ignored
+    for path in cache_dir.listdir():
+        path.write("corrupted")
+    config = Config.load_yaml(str(file), description="My app")
+    assert config.apps["backend"].app.type == "flask.Flask"
+
+def test_cache_eviction(tmpdir, cache_dir, monkeypatch):
+    monkeypatch.setattr(config_module, "MAX_CACHE_ENTRIES", 2)
+    # Left from an older version
+    cache_dir.join("config-old.pickle").write_binary(b"not loaded")
+    file = tmpdir.join("subsystems.yaml")
+    file.write(dedent("""
+    apps:
+      backend:
+        app:
+          type: fastapi.FastAPI
+          description: "${{ description }}"
+    """))
+    for i in range(4):
+        Config.load_yaml(str(file), description=f"App {i}")
+    paths = cache_dir.listdir()
+    assert len(paths) == 2
+    assert all(path.ext == ".json" for path in paths)
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_parallel(tmpdir, tmpsyspath, parallel):
+    tmpsyspath.append(str(tmpdir))
+    sync_module = f"sync_{uuid.uuid4().hex}"
+    tmpdir.join(f"{sync_module}.py").write("barrier = None\n")
+    sync = importlib.import_module(sync_module)
+    if parallel:
+        # Passes only if both apps are imported at the same time
+        sync.barrier = threading.Barrier(2, timeout=10)
+
+    modules = [f"app_{uuid.uuid4().hex}" for _ in range(2)]
+    for name in modules:
+        tmpdir.join(f"{name}.py").write(dedent(f"""
+        import threading
+        from fastapi import FastAPI
+        from {sync_module} import barrier
+        thread = threading.current_thread().name
+        if barrier is not None:
+            barrier.wait()
+        app = FastAPI()
+        """))
+    systems = Config.parse({
+        "parallel": parallel,
+        "apps": {
+            "a": {"app": {"instance": f"{modules[0]}:app"}, "server": {"type": "uvicorn.Server"}},
+            "b": {"app": {"instance": f"{modules[1]}:app"}, "server": {"type": "uvicorn.Server"}},
+        }
+    })
+    assert list(systems.systems) == ["a", "b"]
+    threads = {sys.modules[name].thread for name in modules}
+    if parallel:
+        assert len(threads) == 2
+        assert all(thread.startswith("subsystems-create") for thread in threads)
+    else:
+        assert threads == {threading.current_thread().name}
+
+    durations = systems.timeline.get_durations()
+    assert set(durations) == {"a", "b"}
+    for phases in durations.values():
+        assert set(phases) == {"import", "instantiate", "server"}
+
+def test_parallel_default():
+    assert not Config(apps={}).parallel
@@ -1,6 +1,11 @@
 
 from threading import Thread
+import asyncio
+import threading
 from textwrap import dedent
+import os
+import signal
+import socket
 import sys
 import time
 import uuid
@@ -11,6 +16,8 @@ import requests
 
 from subsystems.config import Config
 from subsystems.systems import Subsystems
+from subsystems.apps import AutoAPI
+from subsystems.servers import ProcessServer, ServerBase, UvicornServer
 
 @pytest.mark.parametrize("server",
     [
@@ -117,3 +124,335 @@ def test_flask(tmpdir, request, tmpsyspath, server, port):
         assert output.text == 'Hello world'
     finally:
         systems["backend"].handle_exit()
+
+def test_process(tmpdir, tmpsyspath, port):
+    tmpsyspath.append(str(tmpdir))
+    randstr = uuid.uuid4().hex
+    module_name = f"config_{randstr}"
+
+    file = tmpdir.join(f"{module_name}.py")
+    file.write(dedent("""
+    import os
+    from fastapi import FastAPI
+    myapp = FastAPI()
+    @myapp.get("/")
+    def get_pid():
+        return os.getpid()
+    """))
+    systems = Subsystems.from_config(
+        {
+            "process": True,
+            "apps": {
+                "backend": {
+                    "app": {
+                        "instance": f"{module_name}:myapp",
+                    },
+                    "server": {
+                        "type": "uvicorn.Server",
+                        "host": "localhost",
+                        "port": f"{port}"
+                    }
+                }
+            }
+        }
+    )
+    server = systems["backend"]
+    assert isinstance(server, ProcessServer)
+
+    t = Thread(target=systems.run, args=())
+    t.start()
+    try:
+        for _ in range(100):
+            try:
+                output = requests.get(f"http://localhost:{port}/")
+            except requests.ConnectionError:
+                time.sleep(0.1)
+            else:
+                break
+        assert output.status_code == 200
+        assert output.json() == server.instance.pid != os.getpid()
+    finally:
+        systems.handle_exit(signal.SIGTERM, None)
+    t.join(timeout=10)
+    assert not t.is_alive()
+    # Uvicorn re-raises the signal after shutting down
+    assert server.instance.exitcode in (0, -signal.SIGTERM)
+
+class CrashingProcess:
+    "Process that crashes after running a while"
+    def __init__(self, server, runtime):
+        self.server = server
+        self.runtime = runtime
+        self.exitcode = None
+    def start(self):
+        self.server.starts += 1
+    def join(self):
+        time.sleep(self.runtime)
+        self.exitcode = 1
+    def is_alive(self):
+        return False
+
+class CrashingServer(ProcessServer):
+    restart_delay = 0.01
+    def __init__(self, runtime=0.0):
+        self.starts = 0
+        self.runtime = runtime
+        super().__init__()
+    def create(self):
+        return CrashingProcess(self, self.runtime)
+
+def test_process_restarts():
+    server = CrashingServer()
+    asyncio.run(server.serve())
+    assert server.starts == 1 + server.max_restarts
+
+    # Healthy runs are not counted as crash loops
+    server = CrashingServer(runtime=0.02)
+    server.healthy_after = 0.01
+    async def stop_later():
+        task = asyncio.create_task(server.serve())
+        for _ in range(100):
+            if server.starts > server.max_restarts + 1:
+                break
+            await asyncio.sleep(0.01)
+        server.should_exit = True
+        await task
+    asyncio.run(stop_later())
+    assert server.starts > 1 + server.max_restarts
+
+def test_process_exit_during_restart_delay():
+    server = CrashingServer()
+    server.restart_delay = 0.1
+    async def exit_later():
+        task = asyncio.create_task(server.serve())
+        await asyncio.sleep(0.05)
+        server.handle_exit()
+        await task
+    asyncio.run(exit_later())
+    assert server.starts == 1
+
+def test_uvicorn_workers(tmpdir, tmpsyspath, port):
+    if sys.platform == "win32":
+        pytest.skip(reason="Workers require fork")
+    tmpsyspath.append(str(tmpdir))
+    randstr = uuid.uuid4().hex
+    module_name = f"config_{randstr}"
+
+    file = tmpdir.join(f"{module_name}.py")
+    file.write(dedent("""
+    import os
+    from fastapi import FastAPI
+    myapp = FastAPI()
+    @myapp.get("/")
+    def get_pid():
+        return os.getpid()
+    """))
+    systems = Subsystems.from_config(
+        {
+            "apps": {
+                "backend": {
+                    "app": {
+                        "instance": f"{module_name}:myapp",
+                    },
+                    "server": {
+                        "type": "uvicorn.Server",
+                        "workers": 2,
+                        "host": "localhost",
+                        "port": f"{port}"
+                    }
+                }
+            }
+        }
+    )
+    server = systems["backend"]
+
+    t = Thread(target=systems.run, args=())
+    t.start()
+    try:
+        for _ in range(100):
+            try:
+                output = requests.get(f"http://localhost:{port}/")
+            except requests.ConnectionError:
+                time.sleep(0.1)
+            else:
+                break
+        assert output.status_code == 200
+        assert len(server.processes) == 2
+        assert output.json() in {process.pid for process in server.processes}
+    finally:
+        systems.handle_exit(signal.SIGTERM, None)
+    t.join(timeout=10)
+    assert not t.is_alive()
+    assert all(not process.is_alive() for process in server.processes)
+
+def test_uvicorn_workers_auto_api(port):
+    from rocketry import Rocketry
+    api = AutoAPI(scheduler=Rocketry(execution="async"))
+    with pytest.raises(ValueError):
+        UvicornServer(app_instance=api, config={"host": "localhost", "port": port, "workers": 2})
+
+class CrashingWorkersServer(UvicornServer):
+    "Server whose workers crash immediately"
+    check_interval = 0.001
+    restart_delay = 0.01
+    max_restarts = 3
+
+    def _start_workers(self):
+        self._sock = socket.socket()
+        self.starts = []
+        self.processes = [self._start_worker() for _ in range(self.workers)]
+
+    def _start_worker(self):
+        self.starts.append(time.monotonic())
+        return CrashingProcess(self, runtime=0)
+
+def test_uvicorn_workers_restarts():
+    from fastapi import FastAPI
+    server = CrashingWorkersServer(app_instance=FastAPI(), config={"workers": 2})
+    server.prepare()
+    with pytest.raises(RuntimeError):
+        asyncio.run(server.serve_workers())
+    assert len(server.starts) == 2 * (1 + server.max_restarts)
+    # Restarts are backed off
+    first, *_, last = sorted(server.starts)
+    assert last - first >= server.restart_delay * (1 + 2 + 4)
+
+@pytest.mark.parametrize("server",
+    [
+        'werkzeug.serving.make_server',
+        'waitress.create_server',
+    ]
+)
+def test_mixed(tmpdir, tmpsyspath, port, server):
+    tmpsyspath.append(str(tmpdir))
+    randstr = uuid.uuid4().hex
+    module_name = f"config_{randstr}"
+
+    file = tmpdir.join(f"{module_name}.py")
+    file.write(dedent("""
+    from fastapi import FastAPI
+    from flask import Flask
+    asgi_app = FastAPI()
+    wsgi_app = Flask(__name__)
+
+    @asgi_app.get("/")
+    def get_asgi():
+        return "Hello ASGI"
+
+    @wsgi_app.route('/')
+    def get_wsgi():
+        return 'Hello WSGI'
+    """))
+    systems = Subsystems.from_config(
+        {
+            "apps": {
+                "backend": {
+                    "app": {"instance": f"{module_name}:asgi_app"},
+                    "server": {"type": "uvicorn.Server", "host": "localhost", "port": f"{port}"}
+                },
+                "frontend": {
+                    "app": {"instance": f"{module_name}:wsgi_app"},
+                    "server": {"type": server, "host": "localhost", "port": f"{port + 1}"}
+                },
+            }
+        }
+    )
+
+    started = []
+    systems.on_started.append(lambda: started.append(True))
+
+    t = Thread(target=systems.run, args=())
+    t.start()
+    try:
+        for url, expected in [(f"http://localhost:{port}/", '"Hello ASGI"'), (f"http://localhost:{port + 1}/", 'Hello WSGI')]:
+            for _ in range(100):
+                try:
+                    output = requests.get(url)
+                except requests.ConnectionError:
+                    time.sleep(0.05)
+                else:
+                    break
+            assert output.status_code == 200
+            assert output.text == expected
+    finally:
+        systems.handle_exit(signal.SIGTERM, None)
+    t.join(timeout=10)
+    assert not t.is_alive()
+    assert started == [True]
+    durations = systems.timeline.get_durations()
+    assert "start" in durations["backend"]
+    assert "start" in durations["frontend"]
+
+def test_shutdown_report():
+
+    class EventServer(ServerBase):
+        def create(self):
+            return threading.Event()
+
+        async def serve(self):
+            while not self.instance.is_set():
+                await asyncio.sleep(0.01)
+
+        def handle_exit(self, *args, **kwargs):
+            self.instance.set()
+
+    class StuckServer(EventServer):
+        "Server that cannot shut down gracefully"
+        def handle_exit(self, *args, **kwargs):
+            raise TypeError("Cannot shut down")
+
+        def force_exit(self):
+            self.instance.set()
+
+    class DeadServer(StuckServer):
+        "Server that cannot be stopped at all"
+        def force_exit(self):
+            ...
+
+    class CutApp:
+        "App that had to terminate tasks on shutdown"
+        terminated_tasks = ["do_long", "do_other"]
+
+    systems = Subsystems(normal=EventServer(), stuck=StuckServer(), dead=DeadServer(), cut=EventServer(app_instance=CutApp()))
+    systems.shutdown_timeout = 0.1
+    systems.force_timeout = 0.1
+
+    t = Thread(target=systems.run, args=())
+    t.start()
+    time.sleep(0.1)
+    systems.handle_exit(signal.SIGTERM, None)
+    t.join(timeout=5)
+    assert not t.is_alive()
+    assert systems.shutdown_report == {
+        "normal": "stopped",
+        "stuck": "forced",
+        "dead": "abandoned",
+        "cut": "stopped, terminated tasks: do_long, do_other",
+    }
+
+def test_shutdown_event_stream(port):
+    from rocketry import Rocketry
+    api = AutoAPI(scheduler=Rocketry(execution="async"))
+    systems = Subsystems(backend=UvicornServer(app_instance=api, config={"host": "localhost", "port": port, "log_level": "warning"}))
+    systems.shutdown_timeout = 3
+
+    t = Thread(target=systems.run, args=())
+    t.start()
+    for _ in range(100):
+        try:
+            stream = requests.get(f"http://localhost:{port}/events", stream=True, timeout=5)
+        except requests.ConnectionError:
+            time.sleep(0.05)
+        else:
+            break
+    try:
+        assert stream.status_code == 200
+        start = time.perf_counter()
+        systems.handle_exit(signal.SIGTERM, None)
+        t.join(timeout=10)
+        assert not t.is_alive()
+        # The open stream did not hold the shutdown
+        assert time.perf_counter() - start < systems.shutdown_timeout
+        assert systems.shutdown_report == {"backend": "stopped"}
+    finally:
+        stream.close()
@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Build tools (ie. Webpack) put content hash to the file names
+# and such files never change (ie. main.3f2a1b9c.js,
+# 787.c4e7f8f0.chunk.js and main.3f2a1b9c.js.map)
+HASHED_FILE = re.compile(r"\.[0-9a-f]{8,}(\.chunk)?\.[A-Za-z0-9]+(\.map)?$")
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDATE = "no-cache"
+
+class PrebuiltResponse(Response):
+    "Response of which body and headers are already encoded"
+
+    def __init__(self, body:bytes, raw_headers:List[Tuple[bytes, bytes]], status_code:int=200):
+        self.status_code = status_code
+        self.background = None
+        self.body = body
+        # Copied as middlewares may modify them
+        self.raw_headers = list(raw_headers)
+
+class Asset:
+    """Content in memory
+
+    The compressed variants and the headers are
+    computed once on creation.
+    """
+
+    def __init__(self, content:bytes, media_type:str, immutable:bool=False, min_compress_size:int=1024):
+        self.content = content
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        self.cache_control = CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE
+        self.encodings: Dict[str, bytes] = {}
+        if len(content) >= min_compress_size and media_type.startswith(COMPRESSIBLE_TYPES):
+            variants = {"br": brotli.compress(content)} if brotli is not None else {}
+            variants["gzip"] = gzip.compress(content, compresslevel=9, mtime=0)
+            # Not worth it if the compressed is not smaller
+            self.encodings = {enc: data for enc, data in variants.items() if len(data) < len(content)}
+
+        common = [(b"etag", self.etag.encode("latin-1")), (b"cache-control", self.cache_control.encode("latin-1"))]
+        if self.encodings:
+            common.append((b"vary", b"Accept-Encoding"))
+        self._not_modified_headers = common
+        self._headers = {
+            encoding: [
+                *common,
+                *([(b"content-encoding", encoding.encode("latin-1"))] if encoding is not None else []),
+                (b"content-type", media_type.encode("latin-1")),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ]
+            for encoding, body in [(None, content), *self.encodings.items()]
+        }
+
+    def get_response(self, request:Request) -> Response:
+        "Create response for the request"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and self.etag in _parse_list(if_none_match):
+            return PrebuiltResponse(b"", self._not_modified_headers, status_code=304)
+
+        if self.encodings:
+            accept_encoding = request.headers.get("accept-encoding", "")
+            for encoding in self.encodings:
+                if accepts_encoding(accept_encoding, encoding):
+                    return PrebuiltResponse(self.encodings[encoding], self._headers[encoding])
+        return PrebuiltResponse(self.content, self._headers[None])
+
+class AssetCache:
+    """In-memory cache of static files
+
+    The files are read and compressed once when loaded.
+    Files larger than max_file_size and the files beyond
+    max_total_size are not cached (see skipped).
+    """
+
+    def __init__(self, directory:Union[str, Path], min_compress_size:int=1024,
+                 max_file_size:int=10 * 1024 * 1024, max_total_size:int=100 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.min_compress_size = min_compress_size
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.assets: Dict[str, Asset] = {}
+        self.skipped: Set[str] = set()
+
+    def load(self):
+        "Read the files in the directory"
+        assets = {}
+        skipped = set()
+        total_size = 0
+        for path in sorted(self.directory.rglob("*")):
+            if not path.is_file():
+                continue
+            route = path.relative_to(self.directory).as_posix()
+            size = path.stat().st_size
+            if size > self.max_file_size or total_size + size > self.max_total_size:
+                skipped.add(route)
+                continue
+            total_size += size
+            media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            assets[route] = Asset(
+                path.read_bytes(),
+                media_type=media_type,
+                immutable=HASHED_FILE.search(path.name) is not None,
+                min_compress_size=self.min_compress_size,
+            )
+        self.assets = assets
+        self.skipped = skipped
+
+    def get(self, route:str) -> Optional[Asset]:
+        return self.assets.get(route)
+
+def _parse_list(value:str):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+def accepts_encoding(accept_encoding:Optional[str], encoding:str) -> bool:
+    "Whether the Accept-Encoding header allows the encoding"
+    accepted = _parse_accept_encoding(accept_encoding or "")
+    return accepted.get(encoding, accepted.get("*", 0)) > 0
+
+def _parse_accept_encoding(value:str) -> Dict[str, float]:
+    encodings = {}
+    for item in _parse_list(value):
+        encoding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, val = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(val)
+                except ValueError:
+                    pass
+        encodings[encoding.lower()] = quality
+    return encodings
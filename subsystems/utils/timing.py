@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NamedTuple, Optional
+
+class Span(NamedTuple):
+    "Phase of the startup"
+    phase: str
+    app: Optional[str]
+    start: float
+    end: float
+    thread: int
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+class Timeline:
+    "Timings of the phases of the startup"
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, phase:str, app:str=None):
+        "Measure the time spent in the block"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            span = Span(phase, app, start, time.perf_counter(), threading.get_ident())
+            with self._lock:
+                self.spans.append(span)
+
+    def get_durations(self) -> Dict[str, Dict[str, float]]:
+        "Get durations of the phases by app"
+        durations = {}
+        for span in self.spans:
+            phases = durations.setdefault(span.app, {})
+            phases[span.phase] = phases.get(span.phase, 0) + span.duration
+        return durations
+
+    def to_text(self) -> str:
+        "Format the timeline as a table"
+        spans = sorted(self.spans, key=lambda span: span.start)
+        origin = spans[0].start if spans else 0
+        rows = [("app", "phase", "start (ms)", "duration (ms)")]
+        for span in spans:
+            rows.append((
+                span.app or "-", span.phase,
+                f"{(span.start - origin) * 1000:.1f}", f"{span.duration * 1000:.1f}"
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(4)]
+        return "\n".join(
+            "  ".join(
+                col.ljust(width) if i < 2 else col.rjust(width)
+                for i, (col, width) in enumerate(zip(row, widths))
+            )
+            for row in rows
+        )
+
+    def to_chrome_trace(self) -> str:
+        "Format the timeline as Chrome trace (chrome://tracing, Perfetto)"
+        origin = min((span.start for span in self.spans), default=0)
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.phase, "cat": span.app or "subsystems", "ph": "X",
+                "ts": (span.start - origin) * 1e6, "dur": span.duration * 1e6,
+                "pid": pid, "tid": span.thread,
+                "args": {"app": span.app},
+            }
+            for span in self.spans
+        ]
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})